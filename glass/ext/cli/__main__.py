@@ -3,25 +3,38 @@
 """GLASS command line interface"""
 
 import sys
-if sys.version_info < (3, 10):
-    from importlib_metadata import entry_points
-else:
-    from importlib.metadata import entry_points
+from functools import lru_cache, partial
 
 import click
 
-from .config import load_config
+
+@lru_cache(maxsize=None)
+def commands():
+    """Return the table of command entry points, loaded once."""
+    if sys.version_info < (3, 10):
+        from importlib_metadata import entry_points
+    else:
+        from importlib.metadata import entry_points
+    return {ep.name: ep for ep in entry_points(group="glass.cli")}
 
 
 class CLI(click.MultiCommand):
 
+    def parse_args(self, ctx, args):
+        raw = list(args)
+        rest = super().parse_args(ctx, args)
+        if ctx.params.get("server"):
+            from ._serve import forward
+            raw.remove("--server")
+            ctx.exit(forward(raw))
+        return rest
+
     def list_commands(self, ctx):
-        eps = entry_points(group="glass.cli")
-        return [ep.name for ep in eps]
+        return list(commands())
 
     def get_command(self, ctx, name):
-        eps = entry_points(name=name, group="glass.cli")
-        for ep in eps:
+        ep = commands().get(name)
+        if ep is not None:
             return ep.load()
 
 
@@ -30,10 +43,34 @@ class CLI(click.MultiCommand):
               multiple=True, help="Configuration file (can be repeated).")
 @click.option("-D", "--no-defaults", is_flag=True,
               help="Do not load default configuration.")
+@click.option("-o", "--option", "options", metavar="KEY=VALUE",
+              multiple=True,
+              help="Override a configuration option (can be repeated).")
+@click.option("--profile", metavar="PREFIX", envvar="GLASS_PROFILE",
+              help="Write timings of all stages to PREFIX.json and "
+                   "PREFIX.trace.json.")
+@click.option("--progress", type=click.Choice(["json"]),
+              envvar="GLASS_PROGRESS",
+              help="Write progress events in the given format.")
+@click.option("--progress-file", type=click.File("a", lazy=False),
+              envvar="GLASS_PROGRESS_FILE",
+              help="Append progress events to this file instead of stderr.")
+@click.option("--server", is_flag=True,
+              help="Run the command on the server started by 'glass serve'.")
 @click.pass_context
-def cli(ctx, config, no_defaults):
-    cfg = load_config(config, no_defaults=no_defaults)
-    ctx.obj = cfg
+def cli(ctx, config, no_defaults, options, profile, progress, progress_file,
+        server):
+    # the configuration is only loaded when a command asks for it
+    from .config import LazyConfig
+    ctx.obj = LazyConfig(ctx)
+    if profile:
+        from . import _profile
+        _profile.enable()
+        ctx.call_on_close(partial(_profile.write, profile))
+    if progress:
+        from . import _progress
+        _progress.enable(progress_file or sys.stderr)
+        ctx.call_on_close(_progress.disable)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for tracking build targets."""
+
+import json
+import os
+import os.path
+import warnings
+
+from ._util import config_hash, write_atomic
+
+STATE_FILE = ".glass-build.json"
+
+TARGETS = ("cls", "lensing-cls", "shells", "correlations", "lensing")
+
+# config options that each target depends on
+DEPENDS = {
+    "cls": ("cosmo", "shells", "fields", "compute.cls"),
+    "lensing-cls": ("cosmo", "shells", "fields", "compute.cls",
+                    "compute.lensing", "plot.lensing.redshifts"),
+    "shells": ("cosmo", "shells"),
+    "correlations": ("cosmo", "shells", "fields", "plot.accuracy"),
+    "lensing": ("cosmo", "shells", "fields", "compute.lensing",
+                "plot.accuracy", "plot.lensing.redshifts"),
+}
+
+
+def upstream(config, target):
+    """Return the targets whose outputs *target* reads."""
+    deps = []
+    if (target in ("correlations", "lensing")
+            and config.getstr("fields.cls", None) == "load"):
+        deps.append("cls")
+    if target == "lensing":
+        deps.append("lensing-cls")
+    return deps
+
+
+def target_key(config, target):
+    """Return the hash of the config options that *target* depends on."""
+    return config_hash(config, DEPENDS[target])
+
+
+def file_stamp(path):
+    """Return the modification time and size of a file, or None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def state_path(config):
+    return config.getstr("build.state", STATE_FILE)
+
+
+def load_state(config):
+    """Load the recorded state of all targets."""
+    try:
+        with open(state_path(config)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def record(config, target, path):
+    """Record that *target* was written to *path* for the config."""
+    state = load_state(config)
+    state[target] = {
+        "key": target_key(config, target),
+        "path": path,
+        "stamp": file_stamp(path),
+        "inputs": {dep: state.get(dep, {}).get("stamp")
+                   for dep in upstream(config, target)},
+    }
+    data = json.dumps(state, indent=2).encode()
+    write_atomic(state_path(config), lambda fp: fp.write(data))
+
+
+def stale(config, target, path, state=None):
+    """Return why *target* at *path* needs rebuilding, or None."""
+    if state is None:
+        state = load_state(config)
+    if not os.path.exists(path):
+        return "output missing"
+    entry = state.get(target)
+    if entry is None or entry.get("path") != path:
+        return "no record"
+    if entry.get("key") != target_key(config, target):
+        return "configuration changed"
+    if entry.get("stamp") != file_stamp(path):
+        return "output modified"
+    inputs = entry.get("inputs", {})
+    for dep in upstream(config, target):
+        if dep not in inputs:
+            return f"new input '{dep}'"
+        if inputs[dep] != state.get(dep, {}).get("stamp"):
+            return f"input '{dep}' changed"
+    return None
+
+
+def warn_if_stale(config, target, path):
+    """Warn if the recorded output of *target* is out of date."""
+    entry = load_state(config).get(target)
+    if entry is None or entry.get("path") != path:
+        return
+    if entry.get("key") != target_key(config, target):
+        warnings.warn(f"'{path}' was computed for a different "
+                      "configuration; rebuild it with 'glass build "
+                      f"{target}'")
@@ -0,0 +1,174 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for the on-disk cache."""
+
+import os
+import os.path
+
+from ._profile import stage
+from ._util import config_hash, parse_size, write_atomic
+
+DEFAULT_SIZE = "10G"
+
+CLS_SECTIONS = ("cosmo", "shells", "fields", "compute.cls.bandwidth")
+
+# most recent Cls, kept in memory by long-running processes
+_recent = {"enabled": False, "key": None, "cls": None}
+
+
+def cache_dir(config):
+    """Return the cache directory from config or the environment."""
+    path = config.getstr("cache.path", None)
+    if path is None:
+        path = os.environ.get("GLASS_CACHE_DIR")
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME", "~/.cache")
+        path = os.path.join(base, "glass")
+    return os.path.expanduser(path)
+
+
+def cache_size(config):
+    """Return the size limit of the cache in bytes."""
+    return parse_size(config.getstr("cache.size", DEFAULT_SIZE))
+
+
+def cache_entries(directory):
+    """Return a list of (path, size, last use) for cache entries.
+
+    Entries are sorted from least to most recently used.
+
+    """
+    entries = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+    entries.sort(key=lambda entry: entry[2])
+    return entries
+
+
+def prune_cache(directory, maxsize):
+    """Evict least recently used entries until the cache fits *maxsize*.
+
+    Returns the list of removed paths.
+
+    """
+    entries = cache_entries(directory)
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for path, size, _ in entries:
+        if total <= maxsize:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def cache_path(config, kind, key, suffix=".npz"):
+    """Return the path of a cache entry for *kind* and *key*."""
+    return os.path.join(cache_dir(config), kind, f"{key}{suffix}")
+
+
+def store(config, path, write):
+    """Atomically store a cache entry using ``write(fp)``, then prune."""
+    write_atomic(path, write)
+    prune_cache(cache_dir(config), cache_size(config))
+
+
+def touch(path):
+    """Mark a cache entry as recently used."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def cls_key(config, n):
+    """Return the cache key of the matter Cls of *n* shells for the config.
+
+    Tiled Cls can differ from untiled ones in the last digits, so that the
+    key includes the effective tile size of 'compute.cls.tile'.
+
+    """
+    from ._cls import cls_bandwidth, effective_tile
+    tile = effective_tile(n, config.getint("compute.cls.tile", None),
+                          cls_bandwidth(config))
+    extra = {} if tile is None else {"compute.cls.tile": tile}
+    return config_hash(config, CLS_SECTIONS, extra)
+
+
+def keep_cls(enabled=True):
+    """Keep the most recent cached Cls in memory between calls."""
+    _recent.update(enabled=enabled, key=None, cls=None)
+
+
+def cached_cls(config, shells, cosmo, compute=None):
+    """Return matter Cls for the config, using the cache if possible.
+
+    Cls that are loaded from file are never cached, memory-mapped files
+    are opened directly, and loaded Cls are returned in double precision.
+    Setting the 'cache.size' option to zero disables the cache.  On a
+    miss, the Cls are computed by *compute*, which defaults to
+    ``cls_from_config``, or to the tiled or banded Cls of ``compute_cls``
+    if the config has a tile size or a bandwidth.
+
+    """
+    from glass.ext.config import cls_from_config
+    from ._cls import (cls_bandwidth, compute_cls, effective_tile,
+                       is_mmap_file, matter_cls, ClsFile, upcast)
+    method = config.getstr("fields.cls", None)
+    if compute is None:
+        tile = config.getint("compute.cls.tile", None)
+        bandwidth = cls_bandwidth(config)
+        if method == "load":
+            compute = cls_from_config
+        elif effective_tile(len(shells), tile, bandwidth) is None:
+            compute = matter_cls
+        else:
+            from functools import partial
+            from ._shells import matter_setup
+            compute = partial(compute_cls, setup=matter_setup, tile=tile,
+                              bandwidth=bandwidth)
+    if method == "load":
+        path = config.getstr("fields.cls.path", None)
+        if path is not None and is_mmap_file(path):
+            return ClsFile(path)
+        with stage("matter_cls", method="load"):
+            cls = compute(config, shells, cosmo)
+        return [upcast(cl) if cl is not None else None for cl in cls]
+    if cache_size(config) <= 0:
+        with stage("matter_cls"):
+            return compute(config, shells, cosmo)
+    from zipfile import BadZipFile
+    from glass.user import load_cls, save_cls
+    key = cls_key(config, len(shells))
+    path = cache_path(config, "cls", key)
+    if _recent["key"] == key and os.path.exists(path):
+        touch(path)
+        return _recent["cls"]
+    cls = None
+    if os.path.exists(path):
+        try:
+            with stage("cache_load"):
+                cls = load_cls(path)
+        except (OSError, ValueError, BadZipFile):
+            pass
+        else:
+            touch(path)
+    if cls is None:
+        with stage("matter_cls"):
+            cls = compute(config, shells, cosmo)
+        store(config, path, lambda fp: save_cls(fp, cls))
+    if _recent["enabled"]:
+        _recent.update(key=key, cls=cls)
+    return cls
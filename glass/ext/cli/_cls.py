@@ -0,0 +1,613 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for computing and storing Cls."""
+
+import os
+import os.path
+import time
+import warnings
+from collections.abc import Sequence
+
+from . import _profile
+from ._profile import stage
+
+NPY_MAGIC = b"\x93NUMPY"
+
+_worker = {}
+
+
+def cls_index(i, j):
+    """Return the index of the Cls for shells *i* and *j* in a list."""
+    if j > i:
+        i, j = j, i
+    return i*(i+1)//2 + i - j
+
+
+def cls_pairs(n):
+    """Return the list of shell pairs in the order of a list of Cls."""
+    return [(i, j) for i in range(n) for j in range(i, -1, -1)]
+
+
+def scale_cls(cls, norms):
+    """Return Cls multiplied by the norms of both shells of each pair."""
+    return [norms[i]*norms[j]*cl
+            for (i, j), cl in zip(cls_pairs(len(norms)), cls)]
+
+
+def cls_bandwidth(config):
+    """Return the number of off-diagonals of Cls to compute, or None.
+
+    This is the 'compute.cls.bandwidth' option.  If it is not set, or
+    set to 'full', all pairs of shells are computed.
+
+    """
+    value = config.getstr("compute.cls.bandwidth", None)
+    if value is None or value == "full":
+        return None
+    return config.getint("compute.cls.bandwidth")
+
+
+def band_pairs(n, bandwidth=None):
+    """Return the number of pairs of *n* shells within *bandwidth*."""
+    if bandwidth is None or bandwidth >= n:
+        return n*(n+1)//2
+    return (bandwidth+1)*n - bandwidth*(bandwidth+1)//2
+
+
+def effective_tile(n, tile=None, bandwidth=None):
+    """Return the tile size used for the Cls of *n* shells, or None.
+
+    If *bandwidth* is given, the tile size defaults to the bandwidth.
+    The result is None if all Cls are computed in a single tile.
+
+    """
+    if bandwidth is not None and (tile is None or tile <= 0):
+        tile = max(bandwidth, 1)
+    if tile is None or tile <= 0 or tile >= n:
+        return None
+    return tile
+
+
+def jobs_tile(n, jobs):
+    """Return the tile size for computing the Cls of *n* shells in *jobs*.
+
+    With *B* tiles, there are ``B*(B-1)/2`` tasks of two tiles each, which
+    compute about ``2*(B-1)/B`` times the Cls of a single task.  The tile
+    size is chosen for the fewest tiles that give a task to every job, so
+    that the fewest Cls are computed twice.
+
+    """
+    blocks = 3
+    while True:
+        tile = -(-n//blocks)
+        count = -(-n//tile)
+        if tile == 1 or count*(count-1)//2 >= jobs:
+            return tile
+        blocks += 1
+
+
+def set_jobs_tile(config, n, jobs, bandwidth=None):
+    """Return the tile size for computing the Cls of *n* shells in *jobs*.
+
+    This is 'compute.cls.tile' if set.  Otherwise, for more than one job
+    and no *bandwidth*, the tile size of :func:`jobs_tile` is set in the
+    config and returned.
+
+    """
+    tile = config.getint("compute.cls.tile", None)
+    if tile is None and bandwidth is None and jobs > 1:
+        tile = jobs_tile(n, jobs)
+        config["compute.cls.tile"] = str(tile)
+    return tile
+
+
+def tile_tasks(n, tile=None, bandwidth=None):
+    """Split the Cls of *n* shells into tasks of at most two tiles.
+
+    Each task is a tuple ``(shells, pairs)`` of the sorted shell indices
+    for which Cls are computed together, and the pairs of shells that
+    the task is responsible for.  Every pair belongs to exactly one task.
+
+    If *bandwidth* is given, only pairs ``(i, j)`` with ``i - j`` up to
+    *bandwidth* are assigned, and tiles too far apart are skipped.  The
+    tile size then defaults to the bandwidth, so that the work grows
+    with the number of shells times the bandwidth.
+
+    """
+    tile = effective_tile(n, tile, bandwidth)
+    if tile is None:
+        tasks = [(tuple(range(n)), tuple(cls_pairs(n)))]
+    else:
+        blocks = [range(k, min(k+tile, n)) for k in range(0, n, tile)]
+        tasks = []
+        for p, bp in enumerate(blocks):
+            # the diagonal tile goes with the first tile, or the previous
+            # tile if banded, since the first tile might be out of band
+            diag = 0 if bandwidth is None else p - 1
+            for q, bq in enumerate(blocks[:p]):
+                if (q != diag and bandwidth is not None
+                        and bp[0] - bq[-1] > bandwidth):
+                    continue
+                pairs = [(i, j) for i in bp for j in bq]
+                if q == diag:
+                    pairs += [(i, j) for i in bp for j in bp if j <= i]
+                if p == 1 and q == 0:
+                    pairs += [(i, j) for i in bq for j in bq if j <= i]
+                tasks.append((tuple(bq) + tuple(bp), tuple(sorted(pairs))))
+    if bandwidth is not None:
+        tasks = [(shells, tuple(pair for pair in pairs
+                                if pair[0] - pair[1] <= bandwidth))
+                 for shells, pairs in tasks]
+    return tasks
+
+
+def matter_cls(config, windows, cosmo):
+    """Compute the Cls of windows with the full cosmology."""
+    from glass.ext.config import cls_from_config
+    from ._shells import full_cosmology
+    return cls_from_config(config, windows, full_cosmology(cosmo))
+
+
+def compute_task(config, windows, cosmo, task):
+    """Compute the Cls of a task, returning a dict of pairs and Cls."""
+    shells, pairs = task
+    with stage("cls_from_config", shells=len(shells)):
+        cls = matter_cls(config, [windows[i] for i in shells], cosmo)
+    local = {shell: k for k, shell in enumerate(shells)}
+    return {(i, j): cls[cls_index(local[i], local[j])] for i, j in pairs}
+
+
+def tail_error(cls):
+    """Return the largest relative variance above each mode of the Cls.
+
+    For every mode *l*, this is the largest fraction of the variance
+    ``sum((2l+1)*cl)`` of any of the Cls that comes from modes above *l*.
+
+    """
+    import numpy as np
+    lmax = min(len(cl) for cl in cls) - 1
+    l = np.arange(lmax+1)
+    error = np.zeros(lmax+1)
+    for cl in cls:
+        var = np.cumsum((2*l+1)*np.fabs(cl[:lmax+1]))
+        if var[-1] > 0:
+            np.maximum(error, (var[-1] - var)/var[-1], out=error)
+    return error
+
+
+def shard_tasks(tasks, k, n):
+    """Return the tasks of shard *k* out of *n* as ``(index, task)`` pairs.
+
+    Shards are numbered from 1 to *n*.  Tasks are assigned largest first
+    to the shard with the least work so far, where the work of a task is
+    the number of Cls computed for its shells, so that every process
+    splitting the same tasks arrives at the same shards.
+
+    """
+    def work(index):
+        m = len(tasks[index][0])
+        return m*(m+1)//2
+
+    loads = [0]*n
+    owner = {}
+    for index in sorted(range(len(tasks)), key=lambda i: (-work(i), i)):
+        s = loads.index(min(loads))
+        loads[s] += work(index)
+        owner[index] = s + 1
+    return [(i, task) for i, task in enumerate(tasks) if owner[i] == k]
+
+
+def read_pairs(npz):
+    """Return the Cls stored under 'i-j' keys of an npz file by pair."""
+    results = {}
+    for key in npz.files:
+        i, sep, j = key.partition("-")
+        if sep:
+            results[int(i), int(j)] = npz[key]
+    return results
+
+
+def load_checkpoint(directory):
+    """Load all finished pairs of Cls from a checkpoint directory."""
+    import numpy as np
+    from zipfile import BadZipFile
+    results = {}
+    if not os.path.isdir(directory):
+        return results
+    for name in sorted(os.listdir(directory)):
+        if name.startswith(".") or not name.endswith(".npz"):
+            continue
+        try:
+            with np.load(os.path.join(directory, name)) as npz:
+                results.update(read_pairs(npz))
+        except (OSError, ValueError, BadZipFile):
+            continue
+    return results
+
+
+def save_checkpoint(directory, k, result):
+    """Atomically save the result of task *k* to a checkpoint directory."""
+    import numpy as np
+    from ._util import write_atomic
+    arrays = {f"{i}-{j}": cl for (i, j), cl in result.items()}
+    write_atomic(os.path.join(directory, f"task-{k:06d}.npz"),
+                 lambda fp: np.savez(fp, **arrays))
+
+
+def _init_worker(setup, config, origin):
+    if origin is not None:
+        _profile.enable(origin)
+    _worker["config"] = config
+    _worker["cosmo"], _worker["windows"] = setup(config)
+
+
+def _run_task(task):
+    start = time.perf_counter()
+    result = compute_task(_worker["config"], _worker["windows"],
+                          _worker["cosmo"], task)
+    # stages recorded in the worker are returned to the parent
+    return result, time.perf_counter() - start, _profile.collect()
+
+
+def compute_tasks(config, windows, cosmo, tasks, *, setup, jobs=1,
+                  checkpoint=None, resume=False):
+    """Compute a list of ``(index, task)`` pairs, returning a dict of Cls.
+
+    See :func:`compute_cls` for the arguments.  A progress event is
+    emitted for every finished task, with the estimated time left.
+
+    """
+    import shutil
+    from ._progress import Progress, emit
+    results = {}
+    if checkpoint is not None:
+        if resume:
+            results = load_checkpoint(checkpoint)
+        elif os.path.exists(checkpoint):
+            shutil.rmtree(checkpoint)
+        if len(tasks) > 1:
+            os.makedirs(checkpoint, exist_ok=True)
+        else:
+            if resume:
+                warnings.warn("a single task of Cls has no checkpoint to "
+                              "resume from")
+            checkpoint = None
+    todo = [(k, task) for k, task in tasks
+            if any(pair not in results for pair in task[1])]
+    # work is measured in the number of Cls computed by each task
+    work = {k: len(task[0])*(len(task[0])+1)//2 for k, task in todo}
+    progress = Progress(sum(work.values()))
+    pairs = [0, sum(len(task[1]) for _, task in todo)]
+    emit("cls_started", tasks=len(todo), pairs=pairs[1])
+
+    def done(k, result, wall):
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, k, result)
+        results.update(result)
+        pairs[0] += len(result)
+        emit("cls_pairs", task=k, pairs=len(result), duration=wall,
+             done=pairs[0], total=pairs[1], eta=progress.update(work[k]))
+
+    if jobs > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with stage("compute_pool", tasks=len(todo), jobs=jobs), \
+                ProcessPoolExecutor(min(jobs, len(todo)),
+                                    initializer=_init_worker,
+                                    initargs=(setup, config,
+                                              _profile.origin())) as pool:
+            futures = {pool.submit(_run_task, task): k for k, task in todo}
+            for future in as_completed(futures):
+                result, wall, records = future.result()
+                _profile.merge(records)
+                done(futures[future], result, wall)
+    else:
+        for k, task in todo:
+            start = time.perf_counter()
+            result = compute_task(config, windows, cosmo, task)
+            done(k, result, time.perf_counter() - start)
+    return {pair: results[pair] for _, task in tasks for pair in task[1]}
+
+
+def compute_cls(config, windows, cosmo, *, setup, tile=None, bandwidth=None,
+                jobs=1, checkpoint=None, resume=False):
+    """Compute Cls for windows, optionally split over a process pool.
+
+    The result depends only on *tile*, so that it is the same for any
+    number of *jobs*, but can differ from untiled Cls in the last digits.
+    Raises :class:`ValueError` if more than one job is requested for a
+    single tile of shells.  Worker processes reconstruct the cosmology and
+    windows by calling ``setup(config)``, which must be picklable.
+
+    If *bandwidth* is given, only the Cls of pairs of windows up to that
+    many places apart are computed, and the others are empty arrays.
+
+    If *checkpoint* is given, the result of each finished task is saved
+    in that directory, and if *resume* is true, tasks with saved results
+    are skipped.  The directory is left for the caller to remove once
+    the Cls have been stored.  A single task is not checkpointed, and
+    resuming it warns.
+
+    """
+    import numpy as np
+    n = len(windows)
+    tasks = tile_tasks(n, tile, bandwidth)
+    if jobs > 1 and len(tasks) == 1:
+        raise ValueError("a single tile of shells cannot be computed in "
+                         "parallel; set 'compute.cls.tile' to use --jobs")
+    results = compute_tasks(config, windows, cosmo, list(enumerate(tasks)),
+                            setup=setup, jobs=jobs, checkpoint=checkpoint,
+                            resume=resume)
+    empty = np.empty(0)
+    return [results.get(pair, empty) for pair in cls_pairs(n)]
+
+
+def compute_shard(config, windows, cosmo, shard, *, setup, tile=None,
+                  bandwidth=None, jobs=1, checkpoint=None, resume=False):
+    """Compute the Cls of *shard* ``(k, n)``, returning a dict of pairs.
+
+    The tiles of :func:`tile_tasks` are split into *n* shards by
+    :func:`shard_tasks`.  The other arguments are as for
+    :func:`compute_cls`.
+
+    """
+    k, n = shard
+    tasks = tile_tasks(len(windows), tile, bandwidth)
+    if n > len(tasks):
+        raise ValueError(f"cannot split {len(tasks)} tiles of shells into "
+                         f"{n} shards")
+    return compute_tasks(config, windows, cosmo, shard_tasks(tasks, k, n),
+                         setup=setup, jobs=jobs, checkpoint=checkpoint,
+                         resume=resume)
+
+
+def save_shard(path, results, *, key, shard, shells, bandwidth=None):
+    """Atomically save the Cls of a shard to *path*.
+
+    The file records the config hash *key*, the shard ``(k, n)``, the
+    total number of *shells*, and the *bandwidth* along with the Cls of
+    each pair.
+
+    """
+    import numpy as np
+    from ._util import write_atomic
+    arrays = {f"{i}-{j}": cl for (i, j), cl in results.items()}
+    band = -1 if bandwidth is None else bandwidth
+    with stage("save_shard", pairs=len(arrays)):
+        write_atomic(path, lambda fp: np.savez(fp, config=key,
+                                               shard=np.array(shard),
+                                               shells=shells, bandwidth=band,
+                                               **arrays))
+
+
+def load_shard(path):
+    """Load a shard file written by :func:`save_shard`.
+
+    Returns a dict with the 'config' hash, the 'shard' ``(k, n)``, the
+    number of 'shells', the 'bandwidth', and the 'cls' of each pair.
+
+    """
+    import numpy as np
+    with stage("load_shard"), np.load(path) as npz:
+        try:
+            bandwidth = int(npz["bandwidth"])
+            return {
+                "config": str(npz["config"]),
+                "shard": tuple(int(x) for x in npz["shard"]),
+                "shells": int(npz["shells"]),
+                "bandwidth": bandwidth if bandwidth >= 0 else None,
+                "cls": read_pairs(npz),
+            }
+        except KeyError:
+            raise ValueError(f"'{path}' is not a shard file") from None
+
+
+def merge_shards(paths):
+    """Merge shard files into a list of Cls in the usual order.
+
+    Returns the config hash of the shards and the list of Cls, in which
+    pairs outside the bandwidth of the shards are empty arrays.  Raises
+    :class:`ValueError` if the shards do not come from the same config,
+    or do not make up the complete set of Cls.
+
+    """
+    import numpy as np
+    key = count = shells = bandwidth = None
+    seen = set()
+    results = {}
+    for path in paths:
+        shard = load_shard(path)
+        k, n = shard["shard"]
+        if key is None:
+            key, count, shells = shard["config"], n, shard["shells"]
+            bandwidth = shard["bandwidth"]
+        elif (shard["config"] != key or shard["shells"] != shells
+              or shard["bandwidth"] != bandwidth):
+            raise ValueError(f"shard '{path}' was computed for a different "
+                             "configuration")
+        elif n != count:
+            raise ValueError(f"shard '{path}' is one of {n} shards, "
+                             f"not {count}")
+        if k in seen:
+            raise ValueError(f"shard {k}/{n} is given more than once")
+        seen.add(k)
+        results.update(shard["cls"])
+    if key is None:
+        raise ValueError("no shards to merge")
+    missing = [f"{k}/{count}" for k in range(1, count+1) if k not in seen]
+    if missing:
+        raise ValueError(f"missing shards: {', '.join(missing)}")
+    pairs = cls_pairs(shells)
+    if any(pair not in results for pair in pairs
+           if bandwidth is None or pair[0] - pair[1] <= bandwidth):
+        raise ValueError("shards do not contain all Cls")
+    empty = np.empty(0)
+    return key, [results.get(pair, empty) for pair in pairs]
+
+
+def save_cls_npz(fp, cls, *, dtype=None, compress=False, meta=None):
+    """Write Cls in the format of :func:`glass.user.save_cls`.
+
+    The values are converted to *dtype* if given, and the archive is
+    compressed if *compress* is true.  The dict *meta* is stored as JSON
+    under the 'meta' key if given.
+
+    """
+    import json
+    import numpy as np
+    split = np.cumsum([len(cl) if cl is not None else 0 for cl in cls[:-1]])
+    values = np.concatenate([np.asarray(cl) for cl in cls if cl is not None],
+                            dtype=dtype)
+    extra = {} if meta is None else {"meta": json.dumps(meta)}
+    savez = np.savez_compressed if compress else np.savez
+    savez(fp, values=values, split=split, **extra)
+
+
+def save_cls_mmap(fp, cls, *, dtype=None, meta=None):
+    """Write Cls as an array of offsets followed by an array of values.
+
+    Both arrays are stored in NumPy's ``.npy`` format, so that the values
+    can be memory-mapped.  The Cls of pair *k* in the order of the list
+    are ``values[offsets[k]:offsets[k+1]]``.  The values are converted
+    to *dtype* if given.  The dict *meta* is appended as a third array
+    holding a JSON string if given.
+
+    """
+    import json
+    import numpy as np
+    sizes = [len(cl) if cl is not None else 0 for cl in cls]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    values = np.concatenate([np.asarray(cl) for cl in cls if cl is not None],
+                            dtype=dtype)
+    np.lib.format.write_array(fp, offsets)
+    np.lib.format.write_array(fp, values)
+    if meta is not None:
+        np.lib.format.write_array(fp, np.array(json.dumps(meta)))
+
+
+def upcast(values):
+    """Return *values* in double precision if stored in less."""
+    import numpy as np
+    values = np.asarray(values)
+    dtype = np.promote_types(values.dtype, np.float64)
+    return values.astype(dtype, copy=False)
+
+
+def is_mmap_file(path):
+    """Return whether *path* is a memory-mappable Cls file."""
+    try:
+        with open(path, "rb") as fp:
+            return fp.read(len(NPY_MAGIC)) == NPY_MAGIC
+    except OSError:
+        return False
+
+
+class ClsFile(Sequence):
+    """Read-only, memory-mapped list of Cls from file.
+
+    Items are views into the file, so only the Cls and modes which are
+    accessed are read from disk.  Values stored in single precision are
+    returned as double precision copies.
+
+    """
+
+    def __init__(self, path):
+        import numpy as np
+        with open(path, "rb") as fp:
+            self.offsets = np.lib.format.read_array(fp)
+            version = np.lib.format.read_magic(fp)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(fp)
+            else:
+                header = np.lib.format.read_array_header_2_0(fp)
+            shape, fortran_order, dtype = header
+            offset = fp.tell()
+        self.path = path
+        self.offset = offset
+        self.values = np.memmap(path, dtype=dtype, mode="r", offset=offset,
+                                shape=shape)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("Cls index out of range")
+        return upcast(self.values[self.offsets[k]:self.offsets[k+1]])
+
+    def cl(self, i, j, lmax=None):
+        """Return the Cls for shells *i* and *j*, up to *lmax*."""
+        k = cls_index(i, j)
+        start, stop = self.offsets[k], self.offsets[k+1]
+        if lmax is not None:
+            stop = min(stop, start + lmax + 1)
+        return upcast(self.values[start:stop])
+
+    @property
+    def meta(self):
+        """The metadata stored after the values, or an empty dict."""
+        import json
+        import numpy as np
+        with open(self.path, "rb") as fp:
+            fp.seek(self.offset + self.values.nbytes)
+            if fp.read(len(NPY_MAGIC)) != NPY_MAGIC:
+                return {}
+            fp.seek(-len(NPY_MAGIC), os.SEEK_CUR)
+            return json.loads(str(np.lib.format.read_array(fp)))
+
+
+def save_cls(path, cls, *, format="npz", dtype=None, lmax=None,
+             compress=False, meta=None):
+    """Atomically save Cls to *path* in the given format.
+
+    If *lmax* is given, the Cls are truncated as by the *lmax* argument
+    of :func:`getcl`.  If *dtype* is given, the values are converted.
+    Only the 'npz' format can be compressed.  The dict *meta* is stored
+    with the Cls if given, and can be read with :func:`load_meta`.
+
+    """
+    from functools import partial
+    from ._util import write_atomic
+    if format == "mmap":
+        if compress:
+            raise ValueError("memory-mapped Cls cannot be compressed")
+        write = partial(save_cls_mmap, dtype=dtype, meta=meta)
+    elif format == "npz":
+        write = partial(save_cls_npz, dtype=dtype, compress=compress,
+                        meta=meta)
+    else:
+        raise ValueError(f"unknown Cls format: {format}")
+    if lmax is not None:
+        cls = [cl[:lmax+1] if cl is not None else None for cl in cls]
+    with stage("save_cls", format=format):
+        write_atomic(path, lambda fp: write(fp, cls))
+
+
+def load_cls(path):
+    """Load Cls from *path*, memory-mapping the file if possible.
+
+    Values stored in single precision are returned in double precision.
+
+    """
+    import numpy as np
+    if is_mmap_file(path):
+        return ClsFile(path)
+    with stage("load_cls"), np.load(path) as npz:
+        values = upcast(npz["values"])
+        split = npz["split"]
+    return np.split(values, split)
+
+
+def load_meta(path):
+    """Return the metadata stored with the Cls at *path*, or an empty dict."""
+    import json
+    import numpy as np
+    if is_mmap_file(path):
+        return ClsFile(path).meta
+    with np.load(path) as npz:
+        if "meta" not in npz.files:
+            return {}
+        return json.loads(str(npz["meta"]))
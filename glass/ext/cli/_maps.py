@@ -0,0 +1,92 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for generating and writing maps."""
+
+import click
+
+from ._profile import stage
+
+
+def map_paths(template, n):
+    """Return the output paths for *n* shells from a template.
+
+    The template is formatted with the shell number as 'index', so that
+    for example '{index:03d}' gives zero-padded numbers.
+
+    """
+    paths = [template.format(index=i) for i in range(n)]
+    if len(set(paths)) < n:
+        raise ValueError(f"path '{template}' does not contain '{{index}}'")
+    return paths
+
+
+def write_map(path, m, dtype=None):
+    """Write a HEALPix map to *path*, as FITS or in NumPy's format.
+
+    If *dtype* is given, the map is converted before it is written.
+
+    """
+    import numpy as np
+    from ._util import replace_atomic, write_atomic
+    if dtype is not None:
+        m = m.astype(dtype, copy=False)
+    with stage("write_map", path=path):
+        if path.endswith((".fits", ".fits.gz")):
+            import healpy as hp
+            suffix = ".fits.gz" if path.endswith(".gz") else ".fits"
+            replace_atomic(path, lambda tmp: hp.write_map(
+                tmp, m, dtype=m.dtype, overwrite=True), suffix)
+        else:
+            write_atomic(path, lambda fp: np.save(fp, m))
+    return path
+
+
+def generate_maps(config, shells, cls):
+    """Yield the lognormal matter map of each shell in turn.
+
+    Only the last 'fields.ncorr' shells are kept in memory by the sampler.
+
+    """
+    import numpy as np
+    from glass.fields import generate_lognormal, lognormal_gls
+    nside = config.getint("fields.nside")
+    lmax = config.getint("fields.lmax", None)
+    ncorr = config.getint("fields.ncorr", None)
+    seed = config.getint("fields.seed", None)
+    gls = lognormal_gls(cls, lmax=lmax, ncorr=ncorr, nside=nside)
+    rng = np.random.default_rng(seed)
+    maps = generate_lognormal(gls, nside, ncorr=ncorr, rng=rng)
+    for i in range(len(shells)):
+        with stage("sample_map", index=i):
+            m = next(maps)
+        yield m
+
+
+def write_maps(maps, paths, *, dtype=None, jobs=1):
+    """Write maps to paths as they are generated.
+
+    With more than one job, maps are written by a pool of threads, and
+    at most *jobs* maps are waiting to be written at any time.  Maps are
+    converted to *dtype* before they are handed to the pool.
+
+    """
+    if jobs == 1:
+        for m, path in zip(maps, paths):
+            click.echo(f"Writing map to '{path}' ...")
+            write_map(path, m, dtype)
+        return
+    from concurrent.futures import (ThreadPoolExecutor, FIRST_COMPLETED,
+                                    wait)
+    with ThreadPoolExecutor(jobs) as pool:
+        pending = set()
+        for m, path in zip(maps, paths):
+            if len(pending) >= jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            click.echo(f"Writing map to '{path}' ...")
+            if dtype is not None:
+                m = m.astype(dtype, copy=False)
+            pending.add(pool.submit(write_map, path, m))
+        for future in pending:
+            future.result()
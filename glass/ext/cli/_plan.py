@@ -0,0 +1,174 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for estimating the cost of commands.
+
+Memory is estimated from the size of the data that is held at the same
+time, on top of the memory of the current process after its imports.
+Wall time is calibrated from the timings of earlier runs, which are
+recorded in the cache directory.  Computing Cls is taken to scale with
+the number of Cls values, while plots are dominated by rendering and
+taken to be of constant cost.
+
+"""
+
+import os.path
+
+from ._cls import band_pairs, cls_bandwidth, set_jobs_tile, tile_tasks
+
+TIMINGS_FILE = ".timings.json"
+
+# number of recorded timings that are kept
+MAX_TIMINGS = 100
+
+# bytes per value of the Cls
+VALUE_SIZE = 8
+
+
+def timings_path(config):
+    from ._cache import cache_dir
+    return os.path.join(cache_dir(config), TIMINGS_FILE)
+
+
+def load_timings(config):
+    """Return the list of recorded timings, or an empty list."""
+    import json
+    try:
+        with open(timings_path(config)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return []
+
+
+def record_timing(config, kind, units, wall, workers=1):
+    """Record the wall time of a run of *kind* for *units* of work.
+
+    Recording is best effort and never fails the run.
+
+    """
+    import json
+    from ._util import write_atomic
+    timings = load_timings(config)
+    timings.append({"kind": kind, "units": units, "workers": workers,
+                    "wall": wall})
+    data = json.dumps(timings[-MAX_TIMINGS:]).encode()
+    try:
+        write_atomic(timings_path(config), lambda fp: fp.write(data))
+    except OSError:
+        pass
+
+
+def estimate_time(timings, kind, units, workers=1):
+    """Return the estimated wall time and the number of timings used.
+
+    The estimate is the median rate of recorded runs of *kind*, or None
+    if there are no recorded runs.
+
+    """
+    import statistics
+    rates = [t["wall"]*t["workers"]/t["units"] for t in timings
+             if t["kind"] == kind and t["units"] > 0]
+    if not rates:
+        return None, 0
+    return statistics.median(rates)*units/workers, len(rates)
+
+
+def cls_units(n, lmax, tile=None, bandwidth=None):
+    """Return the units of work for computing the Cls of *n* shells.
+
+    This is the number of Cls values that are computed, including the
+    pairs that are computed more than once when tiling.
+
+    """
+    tasks = tile_tasks(n, tile, bandwidth)
+    return sum(len(s)*(len(s)+1)//2 for s, _ in tasks)*(lmax+1)
+
+
+def cls_workers(n, tile, jobs, bandwidth=None):
+    """Return the number of worker processes used for computing Cls."""
+    tasks = tile_tasks(n, tile, bandwidth)
+    return min(jobs, len(tasks)) if jobs > 1 and len(tasks) > 1 else 0
+
+
+def cls_cached(config, n):
+    """Return whether the matter Cls of *n* shells are in the cache."""
+    from ._cache import cache_path, cache_size, cls_key
+    if cache_size(config) <= 0:
+        return False
+    key = cls_key(config, n)
+    return os.path.exists(cache_path(config, "cls", key))
+
+
+def cls_memory(config, n, lmax, jobs=1):
+    """Return the estimated peak memory for computing Cls in bytes.
+
+    This includes the memory of worker processes, unless the Cls are
+    found in the cache.
+
+    """
+    from ._profile import peak_rss
+    tile = config.getint("compute.cls.tile", None)
+    bandwidth = cls_bandwidth(config)
+    nbytes = band_pairs(n, bandwidth)*(lmax+1)*VALUE_SIZE
+    cached = cls_cached(config, n)
+    workers = 0 if cached else cls_workers(n, tile, jobs, bandwidth)
+    local = max(len(s)*(len(s)+1)//2
+                for s, _ in tile_tasks(n, tile, bandwidth))
+    base = peak_rss() or 0
+    # the Cls are held once as computed and once more when they are saved
+    return base + 2*nbytes + workers*(base + local*(lmax+1)*VALUE_SIZE)
+
+
+def make_plan(config, *, jobs=1):
+    """Return a dict of estimates for computing Cls and making plots.
+
+    The config is expected to have 'fields.cls' set to the method for
+    computing the Cls.  As for computing the Cls, a tile size for *jobs*
+    is set in the config if it has none.
+
+    """
+    from ._profile import peak_rss
+    from ._shells import matter_setup
+
+    _, shells = matter_setup(config)
+    n = len(shells)
+    lmax = config.getint("fields.lmax")
+    bandwidth = cls_bandwidth(config)
+    tile = set_jobs_tile(config, n, jobs, bandwidth)
+    nbins = len(config.getarray(float, "plot.lensing.redshifts"))
+    pairs = band_pairs(n, bandwidth)
+    nbytes = pairs*(lmax+1)*VALUE_SIZE
+    cached = cls_cached(config, n)
+    workers = 0 if cached else cls_workers(n, tile, jobs, bandwidth)
+
+    timings = load_timings(config)
+
+    if cached:
+        wall, runs = 0., 0
+    else:
+        units = cls_units(n, lmax, tile, bandwidth)
+        wall, runs = estimate_time(timings, "cls", units, max(workers, 1))
+    stages = {"compute cls": {"memory": cls_memory(config, n, lmax, jobs),
+                              "time": wall, "runs": runs}}
+
+    import matplotlib.pyplot  # noqa: F401
+    base = peak_rss() or 0
+    data = {
+        "shells": 0,
+        "correlations": nbytes,
+        "lensing": (nbytes + n*n*VALUE_SIZE
+                    + (nbins*(nbins+1)//2 + nbins + n)*(lmax+1)*VALUE_SIZE),
+    }
+    for name, size in data.items():
+        wall, runs = estimate_time(timings, f"plot {name}", 1)
+        stages[f"plot {name}"] = {"memory": base + size, "time": wall,
+                                  "runs": runs}
+
+    return {
+        "shells": n,
+        "pairs": pairs,
+        "lmax": lmax,
+        "output": nbytes,
+        "cached": cached,
+        "workers": workers,
+        "stages": stages,
+    }
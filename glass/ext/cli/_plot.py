@@ -4,15 +4,15 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from matplotlib.colors import LinearSegmentedColormap, Normalize
 from matplotlib.transforms import (BboxBase, BboxTransformTo,
                                    blended_transform_factory)
 
+from ._shells import lensing_kernels, shell_index
 from ._util import get_resource
 
-
-def nearest_shell(redshifts, shells):
-    return [np.argmin([abs(z - w.zeff) for w in shells]) for z in redshifts]
+DISPLAY_SAMPLES = 1000
 
 
 def use_style():
@@ -20,14 +20,58 @@ def use_style():
 
 
 def getcl(cls, i, j, lmax=None):
+    """Return the Cls for shells *i* and *j*, up to *lmax*.
+
+    Pairs that were not computed, such as those outside the bandwidth of
+    banded Cls, are returned as empty arrays.
+
+    """
     if j > i:
         i, j = j, i
     cl = cls[i*(i+1)//2+i-j]
+    if cl is None:
+        cl = np.empty(0)
     if lmax is not None:
         cl = cl[:lmax+1]
     return cl
 
 
+def log_samples(n, num=DISPLAY_SAMPLES):
+    """Return up to about *num* log-spaced indices into *n* samples.
+
+    All indices are kept at the low end, where the log spacing would be
+    finer than one sample.
+
+    """
+    if n <= num:
+        return np.arange(n)
+    return np.unique(np.geomspace(1, n, num).astype(int)) - 1
+
+
+def lensing_approx(lmat, cls, bins):
+    """Contract the multi-plane matrix with the matter Cls.
+
+    Returns the approximate convergence Cls for the source shells in
+    *bins*, computed one row of the packed Cls triangle at a time.  Pairs
+    missing from banded Cls are taken to be zero.
+
+    """
+    n = len(lmat)
+    size = min(len(cl) for cl in cls if cl is not None and len(cl) > 0)
+    zero = np.zeros(size)
+    a = lmat[bins]
+    approx = np.zeros((len(bins), size))
+    for i in range(n):
+        if not a[:, i].any():
+            continue
+        row = [getcl(cls, i, j, size-1) for j in range(i, -1, -1)]
+        row = np.stack([cl if len(cl) > 0 else zero for cl in row])
+        coef = a[:, i, None]*a[:, i::-1]
+        coef[:, 1:] *= 2
+        approx += coef @ row
+    return approx
+
+
 def split_bins(a):
     s = []
     i, j = 0, 0
@@ -85,6 +129,14 @@ def symlog_no_zero(axes):
             tick.draw = dont_draw_zero_tick(tick)
 
 
+def watermark(fig, text):
+    """Write *text* diagonally across the figure."""
+    fig.text(0.5, 0.5, text.upper(), transform=fig.transFigure,
+             fontsize=min(fig.get_size_inches())*12, fontweight="bold",
+             color=plt.rcParams["grid.color"], alpha=0.5, rotation=30,
+             ha="center", va="center", zorder=10)
+
+
 def figsize(w, h):
     figsize = plt.rcParams["figure.figsize"]
     return (w*figsize[0], h*figsize[1])
@@ -93,17 +145,9 @@ def figsize(w, h):
 def plot_shells(shells):
     fig, ax = plt.subplots(1, 1, figsize=figsize(2, 1), layout="constrained")
 
-    z = []
+    z, w = shell_index(shells).total_window()
+
     for shell in shells:
-        z = np.union1d(z, shell.za)
-    w = np.zeros_like(z)
-
-    for i, shell in enumerate(shells):
-        if (i > 0 and shells[i-1].za[-1] == shell.za[0]
-                and shells[i-1].wa[-1] == shell.wa[0]):
-            w += np.interp(z, shell.za[1:], shell.wa[1:], left=0., right=0.)
-        else:
-            w += np.interp(z, shell.za, shell.wa, left=0., right=0.)
         ax.fill_between(shell.za, np.zeros_like(shell.wa), shell.wa,
                         ec="none", fc="C0", alpha=0.33, zorder=1)
         ax.axvline(shell.zeff, c=plt.rcParams["grid.color"],
@@ -131,11 +175,18 @@ def plot_correlations(shells, cls, *, accuracy=1e-2):
     cmap = LinearSegmentedColormap.from_list("corr", ["C0", "C6", "C2"])
 
     for k, ax in enumerate(axes.T.flat):
+        lines, colors = [], []
         for i, w in enumerate(shells):
-            if len(cls[i]) > k+1:
-                r = cls[i][k+1][1:]/np.sqrt(cls[i][0][1:]*cls[i-k-1][0][1:])
-                l = np.arange(1, len(r)+1)
-                ax.plot(l, r, c=cmap(w.zeff/zmax), ls="-", lw=0.5)
+            # pairs outside the bandwidth of banded Cls are empty
+            cl = cls[i][k+1] if len(cls[i]) > k+1 else None
+            if cl is not None and len(cl) > 0:
+                l = log_samples(len(cl) - 1) + 1
+                r = cl[l]/np.sqrt(cls[i][0][l]*cls[i-k-1][0][l])
+                lines.append(np.column_stack([l, r]))
+                colors.append(cmap(w.zeff/zmax))
+        ax.add_collection(LineCollection(lines, colors=colors,
+                                         linestyles="-", linewidths=0.5))
+        ax.autoscale_view()
 
         ax.grid(which="major", axis="y")
         ax.set_ylabel(f"$R_\\ell^{{i,i-{k+1}}}$")
@@ -159,13 +210,18 @@ def plot_correlations(shells, cls, *, accuracy=1e-2):
 
 
 def plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls, *,
-                 accuracy=1e-2):
+                 accuracy=1e-2, samples=None, lmat=None):
 
     from glass.lensing import multi_plane_matrix
 
-    lmat = multi_plane_matrix(shells, cosmo)
+    shells = shell_index(shells)
+
+    if lmat is None:
+        lmat = multi_plane_matrix(shells, cosmo)
 
-    bins = nearest_shell(redshifts, shells)
+    bins = shells.nearest(redshifts)
+
+    zk, wk = lensing_kernels(cosmo, [shells[i].zeff for i in bins], samples)
 
     fig = plt.figure(figsize=figsize(2, len(bins)/3), layout="constrained")
     subfigs = fig.subfigures(1, 2, wspace=0.07)
@@ -173,7 +229,7 @@ def plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls, *,
     axes = subfigs[0].subplots(len(bins), 1, sharex=True, sharey=True,
                                squeeze=False)
 
-    for i, ax in zip(bins, axes.ravel()):
+    for i, ax, w in zip(bins, axes.ravel(), wk):
 
         zsrc = shells[i].zeff
 
@@ -181,9 +237,8 @@ def plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls, *,
                     xycoords="axes fraction", textcoords="offset points",
                     ha="right", va="top", backgroundcolor=(1., 1., 1., 0.5))
 
-        z = np.arange(0, np.nextafter(zsrc+0.01, zsrc), 0.01)
-        w = (3*cosmo.omega_m/2*cosmo.xm(z)/cosmo.xm(zsrc)
-             * cosmo.xm(z, zsrc)*(1 + z)/cosmo.ef(z))
+        n = np.searchsorted(zk, zsrc, side="right")
+        z, w = zk[:n], w[:n]
 
         ax.plot(z, w, c="C1", zorder=0)
         ax.plot(z, w, c="C1", zorder=2, alpha=0.5)
@@ -218,15 +273,12 @@ def plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls, *,
 
     lensing_cls = split_bins(lensing_cls)
 
-    n = len(shells)
-
-    approx_cls = sum(lmat[:, i, None]*lmat[:, j, None]*getcl(matter_cls, i, j)
-                     for i in range(n) for j in range(n))
+    approx_cls = lensing_approx(lmat, matter_cls, bins)
 
     axes = subfigs[1].subplots(len(bins), 1, sharex=True, sharey=True,
                                squeeze=False)
 
-    for i, ax, cl in zip(bins, axes.ravel(), lensing_cls):
+    for i, ax, cl, al in zip(bins, axes.ravel(), lensing_cls, approx_cls):
 
         zsrc = shells[i].zeff
 
@@ -235,7 +287,7 @@ def plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls, *,
                     ha="right", va="top", backgroundcolor=(1., 1., 1., 0.8))
 
         tl = cl[0][1:]
-        al = approx_cls[i][1:]
+        al = al[1:]
         n = min(tl.size, al.size)
         l = np.arange(1, n + 1)
         sl = 1/(l + 0.5)**0.5
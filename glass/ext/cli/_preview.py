@@ -0,0 +1,291 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for approximate Cls of preview plots.
+
+Preview Cls are computed exactly for the lowest modes, and with the
+Limber approximation otherwise.  Windows that do not overlap have no
+Limber Cls, and their Cls are instead computed in the flat-sky
+approximation, from the Fourier transforms of the windows along the
+line of sight.  The matter power spectrum is linear, of the BBKS form,
+normalised to a fixed sigma8, and scaled by the linear growth factor.
+The Cls are evaluated on a coarse logarithmic grid of modes and
+interpolated.  Only distances and the expansion of the cosmology are
+needed, so that no Cls are computed by CAMB.
+
+"""
+
+import numpy as np
+
+# number of modes for which the Cls are evaluated
+PREVIEW_MODES = 40
+
+# modes below which the Cls are computed exactly
+PREVIEW_LEXACT = 30
+
+# largest wavenumber in h/Mpc
+PREVIEW_KMAX = 0.2
+
+# logarithmic step of transverse wavenumbers for flat-sky Cls
+PREVIEW_QSTEP = 0.05
+
+# number of pairs of windows integrated at a time for flat-sky Cls
+PREVIEW_CHUNK = 256
+
+# Hubble distance in Mpc/h
+HUBBLE_DISTANCE = 2997.92458
+
+# parameters of the linear power spectrum
+PREVIEW_SIGMA8 = 0.8
+PREVIEW_NS = 0.96
+
+
+def bbks_power(k, gamma, ns=PREVIEW_NS):
+    """Unnormalised BBKS linear power spectrum for *k* in h/Mpc."""
+    q = k/gamma
+    t = np.log1p(2.34*q)/(2.34*q)
+    t *= (1 + 3.89*q + (16.1*q)**2 + (5.46*q)**3 + (6.71*q)**4)**-0.25
+    return k**ns*t**2
+
+
+def power_spectrum(gamma, sigma8=PREVIEW_SIGMA8, ns=PREVIEW_NS):
+    """Return the linear power spectrum at redshift zero as a function.
+
+    The spectrum is normalised to *sigma8*.
+
+    """
+    kk = np.geomspace(1e-4, 1e2, 2000)
+    x = 8*kk
+    w = 3*(np.sin(x) - x*np.cos(x))/x**3
+    s2 = np.trapz(kk**3*bbks_power(kk, gamma, ns)*w**2, np.log(kk))
+    amp = 2*np.pi**2*sigma8**2/s2
+    return lambda k: amp*bbks_power(k, gamma, ns)
+
+
+def growth(cosmo, z):
+    """Linear growth factor normalised to unity at redshift zero.
+
+    Uses the approximation of Carroll, Press & Turner (1992) for a flat
+    cosmology.
+
+    """
+    def g(z):
+        om = cosmo.omega_m*(1 + z)**3/cosmo.ef(z)**2
+        ol = 1 - om
+        return 2.5*om/(om**(4/7) - ol + (1 + om/2)*(1 + ol/70))
+
+    z = np.asarray(z, dtype=float)
+    return g(z)/(1 + z)/g(0.)
+
+
+def trapezoid_weights(x):
+    """Return the weights of the trapezoidal rule for samples at *x*."""
+    w = np.zeros(len(x))
+    w[1:] += np.diff(x)/2
+    w[:-1] += np.diff(x)/2
+    return w
+
+
+def preview_modes(lmax, num=PREVIEW_MODES):
+    """Return a coarse logarithmic grid of modes from 0 to *lmax*."""
+    return np.unique(np.concatenate([[0], np.geomspace(1, lmax, num)
+                                     .astype(int)]))
+
+
+def spherical_jn(ls, x):
+    """Return the spherical Bessel functions of orders *ls* at *x*.
+
+    Uses upward recurrence where the argument is at least the largest
+    order, and downward recurrence otherwise.
+
+    """
+    x = np.asarray(x, dtype=float)
+    lmax = max(ls)
+    rows = {l: i for i, l in enumerate(ls)}
+    out = np.zeros((len(ls), *x.shape))
+    if 0 in rows:
+        out[rows[0]][x == 0] = 1.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        j0 = np.sinc(x/np.pi)
+        j1 = (j0 - np.cos(x))/x
+    # upward recurrence is stable for x >= l
+    up = x >= lmax
+    xu, a, b = x[up], j0[up], j1[up]
+    for n in range(lmax+1):
+        if n in rows:
+            out[rows[n]][up] = a
+        a, b = b, (2*n+3)/xu*b - a
+    # downward recurrence from far above, normalised to j_0 or j_1
+    down = (x > 0) & ~up
+    xd = x[down]
+    res = np.zeros((len(ls), len(xd)))
+    a, b = np.zeros_like(xd), np.full_like(xd, 1e-300)
+    for n in range(2*lmax+20, -1, -1):
+        a, b = b, (2*n+3)/xd*b - a
+        if n in rows:
+            res[rows[n]] = b
+        if n == 1:
+            c = b.copy()
+        big = np.fabs(b) > 1e250
+        if big.any():
+            a[big] *= 1e-250
+            b[big] *= 1e-250
+            res[:, big] *= 1e-250
+            if n <= 1:
+                c[big] *= 1e-250
+    j0d, j1d = j0[down], j1[down]
+    sel = np.fabs(j0d) > np.fabs(j1d)
+    norm = np.empty_like(j0d)
+    norm[sel] = j0d[sel]/b[sel]
+    norm[~sel] = j1d[~sel]/c[~sel]
+    for i in range(len(ls)):
+        out[i][down] = res[i]*norm
+    return out
+
+
+def exact_cls(windows, cosmo, modes, k, power):
+    """Return the exact Cls of all pairs of windows for the given modes.
+
+    The result has one row per pair in the usual order of Cls.
+
+    """
+    n = len(windows)
+    delta = np.zeros((len(modes), n, len(k)))
+    for i, w in enumerate(windows):
+        x = cosmo.xm(w.za)*HUBBLE_DISTANCE
+        f = w.wa*growth(cosmo, w.za)/np.trapz(w.wa, w.za)
+        jl = spherical_jn(modes, k[:, None]*x)
+        delta[:, i] = jl @ (f*trapezoid_weights(w.za))
+    pk = 2/np.pi*k**2*power(k)*trapezoid_weights(k)
+    cls = np.empty((n*(n+1)//2, len(modes)))
+    for m, d in enumerate(delta):
+        c = (d*pk) @ d.T
+        cls[:, m] = [c[i, j] for i in range(n) for j in range(i, -1, -1)]
+    return cls
+
+
+def overlap(wi, wj):
+    """Return the redshift interval where two windows overlap, if any."""
+    lo, hi = max(wi.za[0], wj.za[0]), min(wi.za[-1], wj.za[-1])
+    return (lo, hi) if lo < hi else None
+
+
+def limber_cl(wi, wj, cosmo, modes, power):
+    """Return the Limber Cls of two overlapping windows."""
+    lo, hi = overlap(wi, wj)
+    z = np.union1d(wi.za, wj.za)
+    z = z[(z >= lo) & (z <= hi)]
+    w = (np.interp(z, wi.za, wi.wa)/np.trapz(wi.wa, wi.za)
+         * np.interp(z, wj.za, wj.wa)/np.trapz(wj.wa, wj.za))
+    x = cosmo.xm(z)
+    z, w, x = z[x > 0], w[x > 0], x[x > 0]
+    f = w*cosmo.ef(z)*growth(cosmo, z)**2/(x**2*HUBBLE_DISTANCE**3)
+    k = (modes[:, None] + 0.5)/(x*HUBBLE_DISTANCE)
+    return np.trapz(f*power(k), z, axis=-1)
+
+
+def window_transform(w, cosmo, k):
+    """Return the mean distance and line-of-sight transform of a window.
+
+    The window is normalised and includes the linear growth factor.
+
+    """
+    x = cosmo.xm(w.za)*HUBBLE_DISTANCE
+    norm = np.trapz(w.wa, w.za)
+    chi = np.trapz(w.wa*x, w.za)/norm
+    f = w.wa*growth(cosmo, w.za)/norm
+    return chi, np.trapz(f*np.exp(1j*k[:, None]*x), w.za, axis=-1)
+
+
+def flat_sky_cls(transforms, pairs, modes, k, power):
+    """Return the flat-sky Cls of pairs of windows from their transforms.
+
+    The power spectrum is tabulated once on a logarithmic grid of the
+    transverse wavenumber, so that the integrals over *k* of a chunk of
+    pairs are a matrix product with the rows of the table that the chunk
+    needs.  The Cls of each pair are then interpolated from the grid.
+
+    """
+    i, j = np.transpose(pairs)
+    chi = np.array([t[0] for t in transforms])
+    ft = np.array([t[1] for t in transforms])
+    re, im = ft.real, ft.imag
+    chi = np.sqrt(chi[i]*chi[j])
+    pos = np.log(modes + 0.5) - np.log(chi)[:, None]
+    lo = pos.min()
+    pos = (pos - lo)/PREVIEW_QSTEP
+    q = np.exp(lo + PREVIEW_QSTEP*np.arange(int(pos.max()) + 2))
+    table = power(np.hypot(k, q[:, None]))*trapezoid_weights(k)
+    cls = np.empty(pos.shape)
+    # pairs at similar distances need the same rows of the table
+    order = np.argsort(chi)
+    for start in range(0, len(order), PREVIEW_CHUNK):
+        s = order[start:start + PREVIEW_CHUNK]
+        r0 = int(pos[s].min())
+        r1 = int(pos[s].max()) + 2
+        c = re[i[s]]*re[j[s]] + im[i[s]]*im[j[s]]
+        integrals = c @ table[r0:r1].T
+        idx = np.minimum(pos[s].astype(int), r1 - 2)
+        t = pos[s] - idx
+        rows = np.arange(len(s))[:, None]
+        cls[s] = ((1 - t)*integrals[rows, idx - r0]
+                  + t*integrals[rows, idx - r0 + 1])
+    return cls/(np.pi*chi[:, None]**2)
+
+
+def approximate_cls(windows, cosmo, lmax, *, power):
+    """Return approximate Cls of all pairs of windows up to *lmax*.
+
+    The Cls are in the usual order of a list of Cls.
+
+    """
+    from ._cls import cls_pairs
+    modes = preview_modes(lmax)
+    low, high = modes[modes < PREVIEW_LEXACT], modes[modes >= PREVIEW_LEXACT]
+    # resolve the phases of windows across the whole range of distances
+    xmax = cosmo.xm(max(w.za[-1] for w in windows))*HUBBLE_DISTANCE
+    k = np.arange(0., PREVIEW_KMAX, np.pi/(8*xmax))
+    pairs = cls_pairs(len(windows))
+    cls = np.empty((len(pairs), len(modes)))
+    cls[:, :len(low)] = exact_cls(windows, cosmo, low, k[1:], power)
+    apart = []
+    for p, (i, j) in enumerate(pairs):
+        if overlap(windows[i], windows[j]):
+            cls[p, len(low):] = limber_cl(windows[i], windows[j], cosmo,
+                                          high, power)
+        else:
+            apart.append(p)
+    if apart and len(high) > 0:
+        transforms = [window_transform(w, cosmo, k) for w in windows]
+        cls[apart, len(low):] = flat_sky_cls(transforms,
+                                             [pairs[p] for p in apart],
+                                             high, k, power)
+    l = np.arange(lmax+1)
+    return [np.interp(np.log(l + 0.5), np.log(modes + 0.5), cl)
+            for cl in cls]
+
+
+def preview_power(config, cosmo):
+    """Return the power spectrum for the config.
+
+    The shape parameter uses the Hubble parameter 'cosmo.h' if set.
+
+    """
+    return power_spectrum(cosmo.omega_m*config.getfloat("cosmo.h", 0.7))
+
+
+def preview_cls(config, shells, cosmo):
+    """Return approximate matter Cls of the shells up to 'fields.lmax'."""
+    lmax = config.getint("fields.lmax")
+    return approximate_cls(shells, cosmo, lmax,
+                           power=preview_power(config, cosmo))
+
+
+def preview_lensing_cls(config, shells, cosmo):
+    """Return approximate lensing Cls for the lensing plot."""
+    from ._cls import scale_cls
+    from .compute import lensing_windows
+    lmax = config.getint("fields.lmax")
+    kerns, norms = lensing_windows(config, cosmo, shells)
+    cls = approximate_cls(kerns, cosmo, lmax,
+                          power=preview_power(config, cosmo))
+    return scale_cls(cls, norms)
@@ -0,0 +1,141 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for profiling stages of commands.
+
+Profiling is enabled by the global ``--profile`` option, or by setting
+the ``GLASS_PROFILE`` environment variable to the output prefix.  Code
+can receive the record of every finished stage by registering a hook
+with :func:`add_hook`.
+
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_state = {"events": None, "origin": 0.}
+_hooks = []
+
+
+def enabled():
+    return _state["events"] is not None or bool(_hooks)
+
+
+def enable(origin=None):
+    """Start recording stages.
+
+    Worker processes pass the *origin* of the parent process, so that
+    their stages are on the same timeline.
+
+    """
+    _state["events"] = []
+    _state["origin"] = time.perf_counter() if origin is None else origin
+
+
+def disable():
+    """Stop recording stages and discard the recorded ones."""
+    _state["events"] = None
+
+
+def origin():
+    """Return the origin of the recorded stages, or None if disabled."""
+    return _state["origin"] if _state["events"] is not None else None
+
+
+def collect():
+    """Return and discard the stages recorded so far."""
+    events = _state["events"] or []
+    if _state["events"] is not None:
+        _state["events"] = []
+    return events
+
+
+def merge(records):
+    """Add stages recorded in another process."""
+    if _state["events"] is not None:
+        _state["events"].extend(records)
+    for record in records:
+        for hook in _hooks:
+            hook(record)
+
+
+def add_hook(hook):
+    """Call ``hook(record)`` for every finished stage."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def peak_rss():
+    """Return the peak resident set size of this process and its
+    children in bytes, or None if not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024
+    self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self, children)*scale
+
+
+@contextmanager
+def stage(name, **args):
+    """Record wall time, CPU time, and peak RSS of a stage."""
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        record = {
+            "name": name,
+            "start": start - _state["origin"],
+            "wall": time.perf_counter() - start,
+            "cpu": time.process_time() - cpu,
+            "peak_rss": peak_rss(),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        if _state["events"] is not None:
+            _state["events"].append(record)
+        for hook in _hooks:
+            hook(record)
+
+
+def write(prefix):
+    """Write recorded stages as JSON and as a Chrome trace-event file.
+
+    The files are ``<prefix>.json`` and ``<prefix>.trace.json``.
+
+    """
+    import json
+    import platform
+    events = _state["events"] or []
+    report = {
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "argv": sys.argv,
+        "stages": events,
+    }
+    with open(f"{prefix}.json", "w") as fp:
+        json.dump(report, fp, indent=2)
+    trace = [{
+        "name": event["name"],
+        "ph": "X",
+        "ts": event["start"]*1e6,
+        "dur": event["wall"]*1e6,
+        "pid": event["pid"],
+        "tid": event["tid"],
+        "args": {"cpu": event["cpu"], "peak_rss": event["peak_rss"],
+                 **event["args"]},
+    } for event in events]
+    with open(f"{prefix}.trace.json", "w") as fp:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, fp)
@@ -0,0 +1,72 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for machine-readable progress events.
+
+Progress events are enabled by the global ``--progress json`` option, or
+by setting the ``GLASS_PROGRESS`` environment variable to ``json``.  Each
+event is written as a single line of JSON with the name of the 'event',
+the Unix 'time', the seconds 'elapsed' since the start of the command,
+and the data of the event.  Only the process that enabled the events
+writes them, so that worker processes stay silent.
+
+"""
+
+import json
+import os
+import time
+
+_state = {"fp": None, "pid": None, "origin": 0.}
+
+
+def enabled():
+    return _state["fp"] is not None and _state["pid"] == os.getpid()
+
+
+def enable(fp):
+    """Start writing progress events to the text stream *fp*."""
+    _state["fp"] = fp
+    _state["pid"] = os.getpid()
+    _state["origin"] = time.perf_counter()
+
+
+def disable():
+    """Stop writing progress events."""
+    _state["fp"] = None
+    _state["pid"] = None
+
+
+def emit(event, **data):
+    """Write a progress event with the given data."""
+    if not enabled():
+        return
+    record = {
+        "event": event,
+        "time": time.time(),
+        "elapsed": time.perf_counter() - _state["origin"],
+        **data,
+    }
+    fp = _state["fp"]
+    fp.write(json.dumps(record) + "\n")
+    fp.flush()
+
+
+class Progress:
+    """Count units of work as they finish and estimate the time left.
+
+    The estimate assumes that the remaining units take as long on
+    average as the finished ones.
+
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def update(self, units):
+        """Add finished *units* and return the estimated time left."""
+        self.done += units
+        if self.done <= 0:
+            return None
+        elapsed = time.perf_counter() - self.start
+        return elapsed*max(self.total - self.done, 0)/self.done
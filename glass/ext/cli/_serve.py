@@ -0,0 +1,161 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for the command server and its client.
+
+Client and server exchange newline-delimited JSON messages over a Unix
+socket.  The client sends one request with the command line arguments,
+working directory, and 'GLASS_*' environment variables.  The server
+runs the command and streams back its output as ``{"out": text}`` and
+``{"err": text}`` messages, followed by ``{"exit": code}``.
+
+"""
+
+import io
+import json
+import os
+import socket
+
+import click
+
+
+def socket_path():
+    """Return the path of the server socket."""
+    path = os.environ.get("GLASS_SOCKET")
+    if path is None:
+        import tempfile
+        base = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+        path = os.path.join(base, f"glass-{os.getuid()}.sock")
+    return path
+
+
+def send(fp, message):
+    fp.write(json.dumps(message).encode() + b"\n")
+    fp.flush()
+
+
+def forward(args, path=None):
+    """Run a command on the server and return its exit code."""
+    if path is None:
+        path = socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as exc:
+        sock.close()
+        raise click.ClickException(f"cannot connect to server at '{path}': "
+                                   f"{exc.strerror}") from None
+    env = {k: v for k, v in os.environ.items() if k.startswith("GLASS_")}
+    with sock, sock.makefile("rwb") as fp:
+        send(fp, {"args": args, "cwd": os.getcwd(), "env": env})
+        for line in fp:
+            message = json.loads(line)
+            if "out" in message:
+                click.echo(message["out"], nl=False)
+            elif "err" in message:
+                click.echo(message["err"], nl=False, err=True)
+            elif "exit" in message:
+                return message["exit"]
+    raise click.ClickException("connection to server was lost")
+
+
+class MessageStream(io.TextIOBase):
+    """Text stream that sends everything written as a message."""
+
+    def __init__(self, fp, key):
+        super().__init__()
+        self.fp = fp
+        self.key = key
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if isinstance(text, bytes):
+            text = text.decode(errors="replace")
+        if text:
+            send(self.fp, {self.key: text})
+        return len(text)
+
+
+def run_command(args):
+    """Run the command line *args* and return the exit code."""
+    import traceback
+    from .__main__ import cli
+    try:
+        code = cli.main(args, prog_name="glass", standalone_mode=False)
+    except click.ClickException as exc:
+        exc.show()
+        return exc.exit_code
+    except click.Abort:
+        click.echo("Aborted!", err=True)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return code if isinstance(code, int) else 0
+
+
+def handle(conn):
+    """Handle a single request on the connection *conn*."""
+    import sys
+    from contextlib import redirect_stderr, redirect_stdout
+    from . import _profile, _progress
+    with conn, conn.makefile("rwb") as fp:
+        line = fp.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+        stdin = sys.stdin
+        try:
+            os.chdir(request["cwd"])
+            os.environ.update(request["env"])
+            sys.stdin = io.StringIO()
+            with redirect_stdout(MessageStream(fp, "out")), \
+                    redirect_stderr(MessageStream(fp, "err")):
+                code = run_command(request["args"])
+        finally:
+            sys.stdin = stdin
+            os.environ.clear()
+            os.environ.update(environ)
+            os.chdir(cwd)
+            _profile.disable()
+            _progress.disable()
+        send(fp, {"exit": code})
+
+
+def serve(path):
+    """Accept and run commands on the socket at *path* until stopped.
+
+    Commands run one at a time in this process, so that imports, the
+    cosmology, shells, and the most recent Cls stay in memory.
+
+    """
+    from ._cache import keep_cls
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(path):
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            sock.close()
+            raise click.ClickException(f"server is already running at "
+                                       f"'{path}'")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    keep_cls()
+    with sock:
+        sock.bind(path)
+        try:
+            os.chmod(path, 0o600)
+            sock.listen()
+            while True:
+                conn, _ = sock.accept()
+                try:
+                    handle(conn)
+                except (OSError, ValueError):
+                    # the client went away or sent a bad request
+                    pass
+        finally:
+            os.unlink(path)
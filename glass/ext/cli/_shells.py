@@ -0,0 +1,318 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Internal module for shells."""
+
+from collections.abc import Sequence
+
+import numpy as np
+
+KERNEL_SAMPLES = 1000
+
+# number of redshifts in the tables of distances and expansion
+TABLE_SAMPLES = 10000
+
+# number of cosmologies and sets of shells kept in memory
+MEMO_SIZE = 8
+
+_memo = {}
+
+
+class ShellIndex(Sequence):
+    """Sequence of shells with a sorted index of effective redshifts.
+
+    The index is built once and can be passed wherever a list of shells
+    is expected, so that plotting and computing reuse it.
+
+    """
+
+    def __init__(self, shells):
+        self.shells = list(shells)
+        self.zeff = np.array([w.zeff for w in self.shells], dtype=float)
+        self.order = np.argsort(self.zeff, kind="stable")
+        self.sorted_zeff = self.zeff[self.order]
+        self._grid = None
+
+    def __len__(self):
+        return len(self.shells)
+
+    def __getitem__(self, i):
+        return self.shells[i]
+
+    def nearest(self, redshifts):
+        """Return the indices of the shells nearest to *redshifts*."""
+        z = np.asarray(redshifts, dtype=float)
+        zs = self.sorted_zeff
+        k = np.searchsorted(zs, z)
+        lo = np.clip(k - 1, 0, len(zs) - 1)
+        hi = np.clip(k, 0, len(zs) - 1)
+        pick = np.where(np.fabs(z - zs[lo]) <= np.fabs(zs[hi] - z), lo, hi)
+        return self.order[pick].tolist()
+
+    @property
+    def grid(self):
+        """Sorted redshift grid of all shells, merged once."""
+        if self._grid is None:
+            self._grid = np.unique(np.concatenate([w.za for w in self]))
+        return self._grid
+
+    def total_window(self):
+        """Return the sum of all window functions on the merged grid.
+
+        Points shared between adjacent windows are only counted once.
+
+        """
+        z = self.grid
+        w = np.zeros_like(z)
+        prev = None
+        for shell in self:
+            za, wa = shell.za, shell.wa
+            if (prev is not None and prev.za[-1] == za[0]
+                    and prev.wa[-1] == wa[0]):
+                za, wa = za[1:], wa[1:]
+            lo = np.searchsorted(z, za[0], side="left")
+            hi = np.searchsorted(z, za[-1], side="right")
+            w[lo:hi] += np.interp(z[lo:hi], za, wa, left=0., right=0.)
+            prev = shell
+        return z, w
+
+
+def transverse(x, omega_k):
+    """Return the transverse comoving distance for comoving distance *x*."""
+    if omega_k > 0:
+        k = omega_k**0.5
+        return np.sinh(x*k)/k
+    if omega_k < 0:
+        k = (-omega_k)**0.5
+        return np.sin(x*k)/k
+    return x
+
+
+class CosmologyTable:
+    """Cosmology with distances and expansion served from dense tables.
+
+    The tables cover the redshifts from zero to the last point of the
+    shells.  Everything else, including redshifts outside the tables, is
+    taken from the full cosmology, which is only created by ``make()``
+    when it is first needed.
+
+    """
+
+    def __init__(self, z, ef, xc, omega_m, omega_k, make):
+        self.z = z
+        self.ef_table = ef
+        self.xc_table = xc
+        self.omega_m = omega_m
+        self.omega_k = omega_k
+        self._make = make
+        self._cosmology = None
+
+    @classmethod
+    def from_cosmology(cls, cosmo, zmax, make, samples=TABLE_SAMPLES):
+        """Tabulate *cosmo* up to redshift *zmax*."""
+        z = np.linspace(0., zmax, samples)
+        table = cls(z, np.asarray(cosmo.ef(z), dtype=float),
+                    np.asarray(cosmo.xc(z), dtype=float), cosmo.omega_m,
+                    getattr(cosmo, "omega_k", 0.), make)
+        table._cosmology = cosmo
+        return table
+
+    @property
+    def cosmology(self):
+        """The full cosmology, created when first needed."""
+        if self._cosmology is None:
+            self._cosmology = self._make()
+        return self._cosmology
+
+    def covers(self, *zs):
+        """Return whether all redshifts *zs* are within the tables."""
+        return all(np.min(z) >= 0 and np.max(z) <= self.z[-1]
+                   for z in zs if z is not None)
+
+    def ef(self, z):
+        if not self.covers(z):
+            return self.cosmology.ef(z)
+        return np.interp(z, self.z, self.ef_table)
+
+    def xc(self, z, zp=None):
+        if not self.covers(z, zp):
+            return self.cosmology.xc(z, zp)
+        x = np.interp(z, self.z, self.xc_table)
+        if zp is not None:
+            x = np.interp(zp, self.z, self.xc_table) - x
+        return x
+
+    def xm(self, z, zp=None):
+        if not self.covers(z, zp):
+            return self.cosmology.xm(z, zp)
+        return transverse(self.xc(z, zp), self.omega_k)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.cosmology, name)
+
+
+def full_cosmology(cosmo):
+    """Return the full cosmology behind a :class:`CosmologyTable`."""
+    if isinstance(cosmo, CosmologyTable):
+        return cosmo.cosmology
+    return cosmo
+
+
+def save_setup(fp, cosmo, shells):
+    """Write the tables of *cosmo* and the windows of *shells* to *fp*."""
+    split = np.cumsum([len(w.za) for w in shells[:-1]])
+    np.savez(fp, z=cosmo.z, ef=cosmo.ef_table, xc=cosmo.xc_table,
+             omega=[cosmo.omega_m, cosmo.omega_k],
+             za=np.concatenate([w.za for w in shells]),
+             wa=np.concatenate([w.wa for w in shells]),
+             zeff=[w.zeff for w in shells], split=split)
+
+
+def load_setup(path, make):
+    """Load the cosmology tables and shells written by :func:`save_setup`.
+
+    The full cosmology is created by ``make()`` when it is needed.
+
+    """
+    from glass.shells import RadialWindow
+    with np.load(path) as npz:
+        omega_m, omega_k = npz["omega"]
+        cosmo = CosmologyTable(npz["z"], npz["ef"], npz["xc"], float(omega_m),
+                               float(omega_k), make)
+        za = np.split(npz["za"], npz["split"])
+        wa = np.split(npz["wa"], npz["split"])
+        shells = [RadialWindow(*w) for w in zip(za, wa, npz["zeff"].tolist())]
+    return cosmo, ShellIndex(shells)
+
+
+def shell_index(shells):
+    """Return a :class:`ShellIndex` for *shells*, reusing an existing one."""
+    if isinstance(shells, ShellIndex):
+        return shells
+    return ShellIndex(shells)
+
+
+def memoize(key, func, *args):
+    """Return ``func(*args)``, reusing a recent result for *key*."""
+    if key in _memo:
+        _memo[key] = _memo.pop(key)
+    else:
+        _memo[key] = func(*args)
+        while len(_memo) > MEMO_SIZE:
+            del _memo[next(iter(_memo))]
+    return _memo[key]
+
+
+def matter_setup(config):
+    """Return the cosmology and indexed matter shells for the config.
+
+    Results are kept in memory for recent configs, so that repeated
+    calls in the same process with unchanged 'cosmo' and 'shells'
+    sections reuse them.  Unless the cache is disabled, the shells and
+    tables of distances and expansion are also stored in the cache, so
+    that later runs only set up the full cosmology if they need it.
+
+    """
+    from zipfile import BadZipFile
+    from glass.ext.config import cosmo_from_config, shells_from_config
+    from ._cache import cache_path, cache_size, store, touch
+    from ._profile import stage
+    from ._util import config_hash
+
+    def make_cosmo():
+        with stage("cosmo_from_config"):
+            return cosmo_from_config(config)
+
+    def cosmology():
+        return memoize(("cosmo", config_hash(config, ("cosmo",))),
+                       make_cosmo)
+
+    def make_shells(cosmo):
+        with stage("shells_from_config"):
+            return ShellIndex(shells_from_config(config, cosmo))
+
+    def make_setup():
+        path = cache_path(config, "setup", key)
+        try:
+            with stage("setup_load"):
+                setup = load_setup(path, cosmology)
+        except (OSError, ValueError, KeyError, BadZipFile):
+            pass
+        else:
+            touch(path)
+            return setup
+        cosmo = cosmology()
+        shells = make_shells(cosmo)
+        zmax = max(w.za[-1] for w in shells)
+        with stage("cosmology_table"):
+            cosmo = CosmologyTable.from_cosmology(cosmo, zmax, cosmology)
+        store(config, path, lambda fp: save_setup(fp, cosmo, shells))
+        return cosmo, shells
+
+    key = config_hash(config, ("cosmo", "shells"))
+    if cache_size(config) <= 0:
+        cosmo = cosmology()
+        shells = memoize(("shells", key), make_shells, cosmo)
+        return cosmo, shells
+    return memoize(("setup", key), make_setup)
+
+
+def lensing_matrix(config, shells, cosmo):
+    """Return the multi-plane matrix of the shells, using the cache."""
+    from zipfile import BadZipFile
+    from glass.lensing import multi_plane_matrix
+    from ._cache import cache_path, cache_size, store, touch
+    from ._profile import stage
+    from ._util import config_hash
+
+    def make_matrix():
+        with stage("multi_plane_matrix"):
+            return multi_plane_matrix(shells, cosmo)
+
+    if cache_size(config) <= 0:
+        return make_matrix()
+    path = cache_path(config, "lensing", config_hash(config,
+                                                     ("cosmo", "shells")))
+    try:
+        with np.load(path) as npz:
+            lmat = npz["matrix"]
+    except (OSError, ValueError, KeyError, BadZipFile):
+        pass
+    else:
+        touch(path)
+        return lmat
+    lmat = make_matrix()
+    store(config, path, lambda fp: np.savez(fp, matrix=lmat))
+    return lmat
+
+
+def lensing_kernels(cosmo, zsrc, samples=None):
+    """Evaluate the lensing kernels of all sources on a shared grid.
+
+    The grid has *samples* points from zero to the highest source
+    redshift, and also contains every source redshift.  Sources below a
+    tenth of the highest source redshift add *samples* points of their
+    own, so that their kernels are resolved as well.  Returns the grid
+    and an array with one kernel per row, which is zero beyond the
+    source redshift.  Distances and expansion are evaluated once on the
+    grid, and the distances between the grid and the sources are derived
+    from them for all sources at once.
+
+    """
+    if samples is None:
+        samples = KERNEL_SAMPLES
+    zsrc = np.asarray(zsrc, dtype=float)
+    zmax = zsrc.max()
+    grids = [np.linspace(0, zmax, samples), zsrc]
+    grids += [np.linspace(0, zs, samples) for zs in zsrc if zs < zmax/10]
+    z = np.unique(np.concatenate(grids))
+    omega_k = getattr(cosmo, "omega_k", 0.)
+    x = np.asarray(cosmo.xc(z), dtype=float)
+    xs = x[np.searchsorted(z, zsrc)]
+    xm = transverse(x, omega_k)
+    f = 3*cosmo.omega_m/2*xm*(1 + z)/cosmo.ef(z)
+    # distances from the grid to each source, zero beyond the source
+    dx = np.clip(xs[:, None] - x, 0., None)
+    w = f*transverse(dx, omega_k)/transverse(xs, omega_k)[:, None]
+    return z, w
@@ -4,6 +4,106 @@
 
 import importlib.resources
 
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
 
 def get_resource(resource):
     return importlib.resources.files(__package__).joinpath(resource)
+
+
+def config_hash(config, sections, extra=None):
+    """Return a canonical hash of the config options in *sections*.
+
+    Items of *sections* can be whole sections such as 'cosmo', or dotted
+    option names such as 'plot.lensing.redshifts', which also select any
+    options below them.  The items of the dict *extra* are hashed as if
+    they were options of the config, replacing any options of the same
+    name.
+
+    """
+    import hashlib
+    import json
+    options = {key: str(value) for key, value in config.items()
+               if any(key == s or key.startswith(f"{s}.") for s in sections)}
+    if extra:
+        options.update((key, str(value)) for key, value in extra.items())
+    options = sorted(options.items())
+    data = json.dumps(options, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def write_atomic(path, write):
+    """Write a file atomically by calling ``write(fp)`` on a temporary file.
+
+    The temporary file is created next to *path* and only renamed to
+    *path* once it has been written completely.
+
+    """
+    def write_file(tmp):
+        with open(tmp, "wb") as fp:
+            write(fp)
+
+    replace_atomic(path, write_file)
+
+
+def replace_atomic(path, write, suffix=None):
+    """Write a file atomically by calling ``write(tmp)`` with a temporary
+    path next to *path*, for writers that need a file name.
+
+    The temporary path ends in *suffix*, or in the extension of *path*.
+
+    """
+    import os
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    if suffix is None:
+        suffix = os.path.splitext(path)[1]
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=suffix)
+    os.close(fd)
+    try:
+        # give the file the default permissions instead of private ones
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def parse_size(size):
+    """Parse a size such as '500M' or '10G' into a number of bytes."""
+    text = str(size).strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    try:
+        value = float(text[:len(text)-len(unit)])
+    except ValueError:
+        raise ValueError(f"invalid size: {size!r}") from None
+    return int(value*SIZE_UNITS[unit])
+
+
+def format_size(nbytes):
+    """Format a number of bytes for humans."""
+    for unit in "", "K", "M", "G":
+        if nbytes < 1024:
+            break
+        nbytes /= 1024
+    else:
+        unit = "T"
+    return f"{nbytes:.0f}{unit}" if unit == "" else f"{nbytes:.1f}{unit}"
+
+
+def format_duration(seconds):
+    """Format a duration in seconds for humans."""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(round(seconds), 60)
+    if minutes < 60:
+        return f"{minutes}m{seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m"
@@ -0,0 +1,290 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Command for benchmarking the command line interface.
+
+The benchmarks run offline: the cosmology, shells, and Cls are synthetic,
+so that neither CAMB nor any stored data are needed.
+
+"""
+
+import click
+
+BENCH_SHELLS = (20, 100)
+BENCH_LMAX = (1000, 5000)
+BENCH_REDSHIFTS = (0.5, 1.0, 2.0)
+BENCH_ZMAX = 3.
+
+BENCHMARKS = {}
+
+
+def benchmark(name, *axes):
+    """Register a benchmark that runs over the given parameter axes.
+
+    The decorated function sets up the benchmark for the parameters and
+    returns the callable that is timed.
+
+    """
+    def register(func):
+        BENCHMARKS[name] = (func, axes)
+        return func
+    return register
+
+
+class FlatLCDM:
+    """Synthetic flat LCDM cosmology with tabulated distances."""
+
+    def __init__(self, omega_m=0.3, zmax=BENCH_ZMAX, samples=10000):
+        import numpy as np
+        self.omega_m = omega_m
+        self._z = np.linspace(0., zmax, samples)
+        f = 1/self.ef(self._z)
+        self._xc = np.concatenate([[0.], np.cumsum((f[1:] + f[:-1])/2
+                                                   * np.diff(self._z))])
+
+    def ef(self, z):
+        import numpy as np
+        z = np.asarray(z, dtype=float)
+        return np.sqrt(self.omega_m*(1 + z)**3 + 1 - self.omega_m)
+
+    def xm(self, z, zp=None):
+        import numpy as np
+        xc = np.interp(z, self._z, self._xc)
+        if zp is None:
+            return xc
+        return np.interp(zp, self._z, self._xc) - xc
+
+
+def synthetic_shells(n):
+    """Return *n* indexed top-hat shells up to the maximum redshift."""
+    import numpy as np
+    from glass.shells import tophat_windows
+    from ._shells import ShellIndex
+    return ShellIndex(tophat_windows(np.linspace(0., BENCH_ZMAX, n + 1)))
+
+
+def synthetic_cls(zeff, lmax):
+    """Return smooth synthetic Cls in the usual order for redshifts."""
+    import numpy as np
+    l = np.arange(lmax + 1)
+    shape = 1/(1 + l)**1.5
+    cls = []
+    for i, zi in enumerate(zeff):
+        for zj in zeff[i::-1]:
+            amp = np.exp(-10*abs(zi - zj))/(1 + zi + zj)
+            cls.append(amp*shape*(1 + 0.1*np.sin(l*(zi + zj))))
+    return cls
+
+
+def draw(fig):
+    import matplotlib.pyplot as plt
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+@benchmark("startup")
+def bench_startup():
+    import subprocess
+    import sys
+    args = [sys.executable, "-m", "glass.ext.cli", "--help"]
+    return lambda: subprocess.run(args, check=True, capture_output=True)
+
+
+@benchmark("load_config")
+def bench_load_config():
+    from .config import load_config
+    return lambda: load_config(())
+
+
+@benchmark("nearest", "shells")
+def bench_nearest(shells):
+    import numpy as np
+    index = synthetic_shells(shells)
+    redshifts = np.linspace(0., BENCH_ZMAX, 1000)
+    return lambda: index.nearest(redshifts)
+
+
+@benchmark("split_bins", "shells", "lmax")
+def bench_split_bins(shells, lmax):
+    from ._plot import split_bins
+    cls = synthetic_cls(synthetic_shells(shells).zeff, lmax)
+    return lambda: split_bins(cls)
+
+
+@benchmark("getcl", "shells", "lmax")
+def bench_getcl(shells, lmax):
+    from ._plot import getcl
+    cls = synthetic_cls(synthetic_shells(shells).zeff, lmax)
+
+    def run():
+        for i in range(shells):
+            for j in range(shells):
+                getcl(cls, i, j, lmax//2)
+
+    return run
+
+
+@benchmark("lensing_windows", "shells")
+def bench_lensing_windows(shells):
+    from .compute import lensing_windows
+    from .config import load_config
+    index = synthetic_shells(shells)
+    redshifts = ", ".join(map(str, index.zeff))
+    config = load_config((), overrides=(f"plot.lensing.redshifts="
+                                        f"{redshifts}",))
+    cosmo = FlatLCDM()
+    return lambda: lensing_windows(config, cosmo, index)
+
+
+@benchmark("plot_shells", "shells")
+def bench_plot_shells(shells):
+    from ._plot import plot_shells
+    index = synthetic_shells(shells)
+    return lambda: draw(plot_shells(index))
+
+
+@benchmark("plot_correlations", "shells", "lmax")
+def bench_plot_correlations(shells, lmax):
+    from ._plot import plot_correlations
+    index = synthetic_shells(shells)
+    cls = synthetic_cls(index.zeff, lmax)
+    return lambda: draw(plot_correlations(index, cls))
+
+
+@benchmark("plot_lensing", "shells", "lmax")
+def bench_plot_lensing(shells, lmax):
+    from ._plot import plot_lensing
+    index = synthetic_shells(shells)
+    cosmo = FlatLCDM()
+    cls = synthetic_cls(index.zeff, lmax)
+    zsrc = index.zeff[index.nearest(BENCH_REDSHIFTS)]
+    lensing_cls = synthetic_cls(zsrc, lmax)
+    return lambda: draw(plot_lensing(BENCH_REDSHIFTS, index, cosmo, cls,
+                                     lensing_cls))
+
+
+def run_benchmark(func, params, repeat):
+    """Time *func* and return the best, median, and all times per call.
+
+    The number of calls per timing is chosen as in :mod:`timeit`, so that
+    fast functions are timed over many calls.
+
+    """
+    import statistics
+    import timeit
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t/number for t in timer.repeat(repeat, number)]
+    return {
+        "params": params,
+        "number": number,
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+    }
+
+
+def environment():
+    """Return the versions and platform the benchmarks ran on."""
+    import platform
+    import sys
+    if sys.version_info < (3, 10):
+        from importlib_metadata import version, PackageNotFoundError
+    else:
+        from importlib.metadata import version, PackageNotFoundError
+    versions = {}
+    for name in ("glass.ext.cli", "glass", "numpy", "matplotlib"):
+        try:
+            versions[name] = version(name)
+        except PackageNotFoundError:
+            versions[name] = None
+    return {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "versions": versions,
+    }
+
+
+def result_key(result):
+    return result["name"], tuple(sorted(result["params"].items()))
+
+
+def parse_ints(ctx, param, value):
+    try:
+        return tuple(int(v) for v in value.split(",") if v.strip())
+    except ValueError:
+        raise click.BadParameter("expected a comma-separated list of "
+                                 "integers") from None
+
+
+@click.command()
+@click.option("--only", help="Comma-separated list of benchmarks to run.")
+@click.option("--shells", default=",".join(map(str, BENCH_SHELLS)),
+              show_default=True, callback=parse_ints,
+              help="Comma-separated numbers of shells.")
+@click.option("--lmax", default=",".join(map(str, BENCH_LMAX)),
+              show_default=True, callback=parse_ints,
+              help="Comma-separated values of lmax.")
+@click.option("-r", "--repeat", type=click.IntRange(min=1), default=3,
+              show_default=True, help="Number of timings per benchmark.")
+@click.option("-o", "--output", type=click.Path(dir_okay=False),
+              help="Write the results as JSON to this file.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False),
+              help="Compare with the JSON results of an earlier run.")
+def cli(only, shells, lmax, repeat, output, compare):
+    """Benchmark the hot paths of the command line interface.
+
+    Every benchmark runs for each number of shells and value of lmax it
+    depends on.  The best time per call is reported, and all timings are
+    written to the JSON output, which can be compared between versions.
+
+    """
+    import itertools
+    import json
+    import matplotlib
+
+    matplotlib.use("agg")
+
+    from ._plot import use_style
+
+    if only is None:
+        names = list(BENCHMARKS)
+    else:
+        names = [name.strip() for name in only.split(",") if name.strip()]
+        for name in names:
+            if name not in BENCHMARKS:
+                raise click.BadParameter(f"unknown benchmark '{name}'",
+                                         param_hint="--only")
+
+    baseline = {}
+    if compare is not None:
+        with open(compare) as fp:
+            baseline = {result_key(result): result
+                        for result in json.load(fp)["results"]}
+
+    use_style()
+
+    matrix = {"shells": shells, "lmax": lmax}
+    results = []
+    for name in names:
+        func, axes = BENCHMARKS[name]
+        for values in itertools.product(*(matrix[axis] for axis in axes)):
+            params = dict(zip(axes, values))
+            result = {"name": name,
+                      **run_benchmark(func(**params), params, repeat)}
+            results.append(result)
+            label = " ".join(f"{k}={v}" for k, v in params.items())
+            line = f"{name:<18} {label:<22} {result['min']*1e3:12.3f} ms"
+            base = baseline.get(result_key(result))
+            if base is not None:
+                line += f" {result['min']/base['min']:8.2f}x"
+            click.echo(line)
+
+    if output is not None:
+        with open(output, "w") as fp:
+            json.dump({**environment(), "repeat": repeat, "results": results},
+                      fp, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,100 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Command for rebuilding outdated files."""
+
+import click
+
+from ._build import TARGETS
+from .config import pass_config
+
+
+def target_path(config, target):
+    """Return the output path of *target*, or None if not configured."""
+    if target == "cls":
+        from .compute import cls_path
+        return cls_path(config)
+    if target == "lensing-cls":
+        return config.getstr("plot.lensing.cls", None)
+    return config.getstr(f"plot.{target}.path", None)
+
+
+@click.command()
+@click.argument("targets", nargs=-1, type=click.Choice(TARGETS))
+@click.option("-n", "--dry-run", is_flag=True,
+              help="Only show which targets would be rebuilt.")
+@click.option("-B", "--always-make", is_flag=True,
+              help="Rebuild all targets unconditionally.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              show_default=True, help="Number of parallel processes.")
+@pass_config
+def cli(config, targets, dry_run, always_make, jobs):
+    """Rebuild outdated Cls files and plots.
+
+    Each target records the configuration options it depends on, and the
+    targets whose output it reads.  A target is rebuilt if its output is
+    missing or modified, if its options changed, or if one of its inputs
+    was rebuilt.  Without TARGETS, all targets with a configured output
+    are built.  Plots are written to the 'plot.<name>.path' options.
+
+    """
+    from glass.ext.config import ConfigError
+    from ._build import load_state, record, stale, upstream
+    from .compute import write_cls, write_lensing_cls
+    from .plot import make_figures, save_figure
+
+    paths = {}
+    for target in TARGETS:
+        try:
+            paths[target] = target_path(config, target)
+        except ConfigError:
+            paths[target] = None
+
+    wanted = set(targets or (t for t in TARGETS if paths[t] is not None))
+    todo = list(wanted)
+    while todo:
+        for dep in upstream(config, todo.pop()):
+            if dep not in wanted:
+                wanted.add(dep)
+                todo.append(dep)
+    for target in wanted:
+        if paths[target] is None:
+            raise click.ClickException(f"no output configured for target "
+                                       f"'{target}'")
+
+    plots = []
+    rebuilt = set()
+    for target in TARGETS:
+        if target not in wanted:
+            continue
+        path = paths[target]
+        reason = "forced" if always_make else stale(config, target, path,
+                                                    load_state(config))
+        if reason is None:
+            # inputs of a dry run are not rebuilt, so check them here
+            for dep in upstream(config, target):
+                if dep in rebuilt:
+                    reason = f"input '{dep}' is rebuilt"
+                    break
+        if reason is None:
+            click.echo(f"'{target}' is up to date")
+            continue
+        click.echo(f"'{target}' needs rebuilding: {reason}")
+        rebuilt.add(target)
+        if dry_run:
+            continue
+        if target == "cls":
+            write_cls(config, path, jobs=jobs)
+        elif target == "lensing-cls":
+            write_lensing_cls(config, path, jobs=jobs)
+        else:
+            plots.append(target)
+
+    if plots:
+        for name, fig in make_figures(config, plots, interactive=False):
+            click.echo(f"Saving '{name}' plot to '{paths[name]}' ...")
+            save_figure(fig, [paths[name]])
+            record(config, name, paths[name])
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,68 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Commands for managing the on-disk cache."""
+
+import click
+
+from .config import pass_config
+
+
+@click.group()
+def cli():
+    """Inspect and manage the cache."""
+
+
+@cli.command()
+@pass_config
+def info(config):
+    """Show the location, size, and limit of the cache."""
+    from ._cache import cache_dir, cache_entries, cache_size
+    from ._util import format_size
+    directory = cache_dir(config)
+    entries = cache_entries(directory)
+    total = sum(size for _, size, _ in entries)
+    click.echo(f"path: {directory}")
+    click.echo(f"entries: {len(entries)}")
+    click.echo(f"size: {format_size(total)}")
+    click.echo(f"limit: {format_size(cache_size(config))}")
+
+
+@cli.command("list")
+@pass_config
+def list_(config):
+    """List cache entries, least recently used first."""
+    import os.path
+    from datetime import datetime
+    from ._cache import cache_dir, cache_entries
+    from ._util import format_size
+    directory = cache_dir(config)
+    for path, size, mtime in cache_entries(directory):
+        used = datetime.fromtimestamp(mtime).isoformat(" ", "seconds")
+        name = os.path.relpath(path, directory)
+        click.echo(f"{used}  {format_size(size):>7}  {name}")
+
+
+@cli.command()
+@click.option("-s", "--size", help="Size limit (default: 'cache.size').")
+@pass_config
+def prune(config, size):
+    """Evict least recently used entries down to the size limit."""
+    from ._cache import cache_dir, cache_size, prune_cache
+    from ._util import parse_size
+    maxsize = parse_size(size) if size is not None else cache_size(config)
+    removed = prune_cache(cache_dir(config), maxsize)
+    click.echo(f"Removed {len(removed)} cache entries.")
+
+
+@cli.command()
+@click.confirmation_option(prompt="Remove all cache entries?")
+@pass_config
+def clear(config):
+    """Remove all cache entries."""
+    from ._cache import cache_dir, prune_cache
+    removed = prune_cache(cache_dir(config), 0)
+    click.echo(f"Removed {len(removed)} cache entries.")
+
+
+if __name__ == "__main__":
+    cli()
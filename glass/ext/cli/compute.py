@@ -2,14 +2,39 @@
 # license: MIT
 """Commands that compute and store data."""
 
+import copy
 import os.path
+import shutil
+import time
+from functools import partial
 import click
-from glass.user import save_cls
-from glass.ext.config import (ConfigError, cls_from_config, cosmo_from_config,
-                              shells_from_config)
 
+from ._cache import cached_cls
+from ._cls import (cls_bandwidth, compute_cls, compute_shard, save_cls,
+                   save_shard, scale_cls, set_jobs_tile)
+from ._progress import emit
+from ._util import config_hash
 from .config import pass_config
 
+CHECKPOINT_SECTIONS = ("cosmo", "shells", "fields", "compute")
+
+format_option = click.option("--format", type=click.Choice(["npz", "mmap"]),
+                             default="npz", show_default=True,
+                             help="File format of the Cls.")
+dtype_option = click.option("--dtype",
+                            type=click.Choice(["float64", "float32"]),
+                            default="float64", show_default=True,
+                            help="Precision of the stored Cls.")
+lmax_option = click.option("--lmax", type=click.IntRange(min=0),
+                           help="Truncate the stored Cls at this mode.")
+compress_option = click.option("--compress", is_flag=True,
+                               help="Compress the stored Cls (npz only).")
+jobs_option = click.option("-j", "--jobs", type=click.IntRange(min=1),
+                           default=1, show_default=True,
+                           help="Number of parallel processes.  The Cls "
+                                "are computed in tiles of shells, which is "
+                                "more work in total than a serial run.")
+
 
 def compute_cls_method(config):
     """Return the method used for computing Cls.
@@ -18,6 +43,7 @@ def compute_cls_method(config):
     back to 'fields.cls' if possible.
 
     """
+    from glass.ext.config import ConfigError
     try:
         method = config.getstr("compute.cls")
     except ConfigError as exc:
@@ -35,18 +61,40 @@ def compute_cls_method(config):
     return method
 
 
-@click.group()
-def cli():
-    """Compute and store simulation files."""
+def lensing_windows(config, cosmo, shells):
+    """Return the normalised lensing kernels and their normalisations."""
+    import numpy as np
+    from glass.shells import RadialWindow
+    from ._shells import lensing_kernels, shell_index
+    shells = shell_index(shells)
+    redshifts = config.getarray(float, "plot.lensing.redshifts")
+    samples = config.getint("compute.lensing.samples", None)
+    zsrc = [shells[i].zeff for i in shells.nearest(redshifts)]
+    z, w = lensing_kernels(cosmo, zsrc, samples)
+    norms = np.trapz(w, z, axis=-1)
+    kerns = []
+    for zs, wk, n in zip(zsrc, w, norms):
+        k = np.searchsorted(z, zs, side="right")
+        kerns += [RadialWindow(za=z[:k], wa=wk[:k]/n, zeff=zs)]
+    return kerns, norms.tolist()
 
 
-@cli.command()
-@click.option("-f", "--force", is_flag=True,
-              help="Force writing over existing file.")
-@pass_config
-def cls(config, force):
-    """Compute and store angular matter power spectra."""
-    method = compute_cls_method(config)
+def lensing_setup(config):
+    """Return the cosmology and lensing kernels for the config."""
+    from ._shells import matter_setup
+    cosmo, shells = matter_setup(config)
+    kerns, _ = lensing_windows(config, cosmo, shells)
+    return cosmo, kerns
+
+
+def cls_path(config):
+    """Return the path for storing matter Cls.
+
+    This will first look at 'compute.cls.path' in the configuration, and
+    fall back to 'fields.cls.path' if possible.
+
+    """
+    from glass.ext.config import ConfigError
     try:
         path = config.getstr("compute.cls.path")
     except ConfigError as exc:
@@ -57,57 +105,521 @@ def cls(config, force):
             raise
         else:
             pass
+    return path
+
+
+def timed_compute(compute, tile, bandwidth, workers):
+    """Wrap *compute* to record the timing of finished computations."""
+    from ._plan import cls_units, record_timing
+
+    def run(config, shells, cosmo):
+        start = time.perf_counter()
+        cls = compute(config, shells, cosmo)
+        units = cls_units(len(shells), len(cls[0]) - 1, tile, bandwidth)
+        record_timing(config, "cls", units, time.perf_counter() - start,
+                      max(workers, 1))
+        return cls
+
+    return run
+
+
+def check_memory(config, n, jobs, max_memory):
+    """Raise an error if computing Cls would exceed *max_memory*."""
+    from ._plan import cls_memory
+    from ._util import format_size
+    memory = cls_memory(config, n, config.getint("fields.lmax"), jobs)
+    if memory > max_memory:
+        raise click.ClickException(f"estimated peak memory "
+                                   f"{format_size(memory)} exceeds the "
+                                   f"limit of {format_size(max_memory)}")
+
+
+def check_tiles(n, tile, bandwidth, *, jobs=1, resume=False):
+    """Raise a usage error if options need more than a single task."""
+    from ._cls import tile_tasks
+    if len(tile_tasks(n, tile, bandwidth)) > 1:
+        return
+    for name, used in ("--jobs", jobs > 1), ("--resume", resume):
+        if used:
+            raise click.UsageError(f"{name} requires the Cls to be computed "
+                                   "in several tasks; set 'compute.cls.tile' "
+                                   "to less than half the number of shells")
+
+
+def emit_setup(cosmo, shells):
+    """Emit progress events for the cosmology and shells."""
+    emit("cosmology_ready", cosmology=type(cosmo).__name__)
+    emit("shells_built", count=len(shells))
+
+
+def emit_estimate(config, n, tile, bandwidth, workers):
+    """Emit the wall time of the Cls estimated from earlier runs."""
+    from ._plan import cls_units, estimate_time, load_timings
+    from ._progress import enabled
+    lmax = config.getint("fields.lmax", None)
+    if not enabled() or lmax is None:
+        return
+    units = cls_units(n, lmax, tile, bandwidth)
+    eta, runs = estimate_time(load_timings(config), "cls", units,
+                              max(workers, 1))
+    emit("cls_estimate", eta=eta, runs=runs)
+
+
+def emit_output(path):
+    """Emit a progress event for a written file."""
+    emit("output_written", path=path, bytes=os.path.getsize(path))
+
+
+def probe_lmax(config):
+    """Return the highest mode for which Cls are probed.
+
+    This is 'fields.lmax', or 3*nside-1 if 'fields.nside' is set and
+    lower, since higher modes are not used for sampling.
+
+    """
+    lmax = config.getint("fields.lmax")
+    nside = config.getint("fields.nside", None)
+    if nside is not None:
+        lmax = min(lmax, 3*nside - 1)
+    return lmax
+
+
+def auto_lmax(config, shells, cosmo, *, jobs=1):
+    """Return the lmax where the Cls have converged, and the error there.
+
+    The auto Cls of each shell are computed alone, in up to *jobs*
+    processes, up to 'fields.lmax', and the selected lmax is the lowest
+    mode above which less than a fraction 'compute.cls.tolerance'
+    (default: 'plot.accuracy') of the variance of any shell remains.  If
+    the tolerance is not met below the highest mode, a warning is issued
+    and that mode is returned with the error just below it.
+
+    """
+    import warnings
+    from ._cls import compute_tasks, tail_error
+    from ._profile import stage
+    from ._shells import matter_setup
+    tolerance = config.getfloat("compute.cls.tolerance", None)
+    if tolerance is None:
+        tolerance = config.getfloat("plot.accuracy", 1e-2)
+    n = len(shells)
+    tasks = [(i, ((i,), ((i, i),))) for i in range(n)]
+    with stage("probe_lmax", shells=n):
+        cls = compute_tasks(config, shells, cosmo, tasks, setup=matter_setup,
+                            jobs=jobs)
+    error = tail_error([cls[i, i] for i in range(n)])
+    lmax = len(error) - 1
+    converged = (error[:lmax] <= tolerance).nonzero()[0]
+    if len(converged) > 0:
+        return int(converged[0]), float(error[converged[0]]), tolerance
+    warnings.warn(f"the Cls do not converge to tolerance {tolerance:g} "
+                  f"below lmax {lmax}")
+    return lmax, float(error[max(lmax-1, 0)]), tolerance
+
+
+def write_cls(config, path, *, format="npz", dtype=None, lmax=None,
+              compress=False, jobs=1, resume=False, max_memory=None,
+              record=True):
+    """Compute matter Cls for the config and write them to *path*.
+
+    The *format*, *dtype*, *lmax*, and *compress* arguments are passed
+    to :func:`save_cls`.  If *max_memory* is given, the computation is
+    refused if its estimated peak memory exceeds that number of bytes.
+    The file is recorded as the 'cls' build target if *record* is true.
+
+    If *lmax* is 'auto', the Cls are only computed up to the mode given
+    by :func:`auto_lmax`, which is recorded in the metadata of the file
+    with the tolerance and the achieved error.
+
+    """
+    from ._build import record as record_target
+    from ._plan import cls_workers
+    from ._shells import matter_setup
+    method = compute_cls_method(config)
+    options = copy.deepcopy(config)
+    options["fields.cls"] = method
+    cosmo, shells = matter_setup(options)
+    emit_setup(cosmo, shells)
+    bandwidth = cls_bandwidth(options)
+    tile = set_jobs_tile(options, len(shells), jobs, bandwidth)
+    check_tiles(len(shells), tile, bandwidth, jobs=jobs, resume=resume)
+    if lmax == "auto":
+        options["fields.lmax"] = str(probe_lmax(options))
+    if max_memory is not None:
+        check_memory(options, len(shells), jobs, max_memory)
+    meta = None
+    if lmax == "auto":
+        click.echo("Selecting lmax from a probe of the Cls ...")
+        lmax, error, tolerance = auto_lmax(options, shells, cosmo, jobs=jobs)
+        click.echo(f"Selected lmax {lmax} with error {error:.3g} "
+                   f"(tolerance {tolerance:g})")
+        emit("lmax_selected", lmax=lmax, error=error, tolerance=tolerance)
+        options["fields.lmax"] = str(lmax)
+        meta = {"lmax": lmax, "error": error, "tolerance": tolerance}
+        lmax = None
     echo_method = click.style(method, bold=True, underline=True)
     echo_path = click.style(path, bold=True, underline=True)
     click.echo(f"Writing '{echo_method}' Cls to '{echo_path}' ...")
+    key = config_hash(options, CHECKPOINT_SECTIONS)
+    checkpoint = f"{path}.{key[:16]}.ckpt"
+    compute = partial(compute_cls, setup=matter_setup, tile=tile,
+                      bandwidth=bandwidth, jobs=jobs, checkpoint=checkpoint,
+                      resume=resume)
+    if not resume:
+        workers = cls_workers(len(shells), tile, jobs, bandwidth)
+        compute = timed_compute(compute, tile, bandwidth, workers)
+        emit_estimate(options, len(shells), tile, bandwidth, workers)
+    cls = cached_cls(options, shells, cosmo, compute)
+    save_cls(path, cls, format=format, dtype=dtype, lmax=lmax,
+             compress=compress, meta=meta)
+    emit_output(path)
+    shutil.rmtree(checkpoint, ignore_errors=True)
+    if record:
+        record_target(config, "cls", path)
+
+
+def shard_path(config, path, shard):
+    """Return the path of a shard of the Cls stored at *path*.
+
+    The path contains the shard ``(k, n)`` and the start of the hash of
+    the configuration, so that shards of different configurations do not
+    overwrite each other.
+
+    """
+    options = copy.deepcopy(config)
+    options["fields.cls"] = compute_cls_method(config)
+    key = config_hash(options, CHECKPOINT_SECTIONS)
+    k, n = shard
+    return f"{path}.{key[:16]}.shard-{k}-of-{n}.npz"
+
+
+def write_shard(config, path, shard, *, jobs=1, resume=False,
+                max_memory=None):
+    """Compute shard ``(k, n)`` of the matter Cls for the config.
+
+    The Cls of the shard are written in full precision to the path given
+    by :func:`shard_path` for *path*.  Shards can be computed anywhere
+    and are combined by :func:`merge_cls`.
+
+    """
+    from ._shells import matter_setup
+    method = compute_cls_method(config)
+    options = copy.deepcopy(config)
+    options["fields.cls"] = method
+    cosmo, shells = matter_setup(options)
+    emit_setup(cosmo, shells)
+    check_tiles(len(shells), options.getint("compute.cls.tile", None),
+                cls_bandwidth(options), resume=resume)
+    if max_memory is not None:
+        check_memory(options, len(shells), jobs, max_memory)
+    key = config_hash(options, CHECKPOINT_SECTIONS)
+    path = shard_path(config, path, shard)
+    echo_method = click.style(method, bold=True, underline=True)
+    echo_path = click.style(path, bold=True, underline=True)
+    click.echo(f"Writing '{echo_method}' Cls shard {shard[0]}/{shard[1]} "
+               f"to '{echo_path}' ...")
+    tile = options.getint("compute.cls.tile", None)
+    bandwidth = cls_bandwidth(options)
+    checkpoint = f"{path}.ckpt"
+    try:
+        results = compute_shard(options, shells, cosmo, shard,
+                                setup=matter_setup, tile=tile,
+                                bandwidth=bandwidth, jobs=jobs,
+                                checkpoint=checkpoint, resume=resume)
+    except ValueError as exc:
+        raise click.ClickException(f"{exc} (use a smaller "
+                                   "'compute.cls.tile')") from None
+    save_shard(path, results, key=key, shard=shard, shells=len(shells),
+               bandwidth=bandwidth)
+    emit_output(path)
+    shutil.rmtree(checkpoint, ignore_errors=True)
+
+
+def merge_cls(config, path, shards=None, *, format="npz", dtype=None,
+              lmax=None, compress=False):
+    """Merge the shards of the matter Cls for the config into *path*.
+
+    If *shards* is not given, all shard files of the config next to
+    *path* are used.  The shards must have been computed for the config.
+    The other arguments are passed to :func:`save_cls`.
+
+    """
+    import glob
+    from ._build import record
+    from ._cls import merge_shards
+    options = copy.deepcopy(config)
+    options["fields.cls"] = compute_cls_method(config)
+    key = config_hash(options, CHECKPOINT_SECTIONS)
+    if not shards:
+        pattern = f"{glob.escape(path)}.{key[:16]}.shard-*-of-*.npz"
+        shards = sorted(glob.glob(pattern))
+        if not shards:
+            raise click.ClickException(f"no shards found for '{path}'")
+    try:
+        shard_key, cls = merge_shards(shards)
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from None
+    if shard_key != key:
+        raise click.ClickException("shards were computed for a different "
+                                   "configuration")
+    echo_path = click.style(path, bold=True, underline=True)
+    click.echo(f"Merging {len(shards)} shards of Cls to '{echo_path}' ...")
+    save_cls(path, cls, format=format, dtype=dtype, lmax=lmax,
+             compress=compress)
+    emit_output(path)
+    record(config, "cls", path)
+
+
+def write_lensing_cls(config, path, *, format="npz", dtype=None, lmax=None,
+                      compress=False, jobs=1, record=True):
+    """Compute lensing Cls for the config and write them to *path*.
+
+    The *format*, *dtype*, *lmax*, and *compress* arguments are passed
+    to :func:`save_cls`.  The file is recorded as the 'lensing-cls'
+    build target if *record* is true.
+
+    """
+    from ._build import record as record_target
+    from ._shells import matter_setup
+    method = compute_cls_method(config)
+    echo_method = click.style(method, bold=True, underline=True)
+    echo_path = click.style(path, bold=True, underline=True)
+    click.echo(f"Writing '{echo_method}' lensing Cls to '{echo_path}' ...")
+    options = copy.deepcopy(config)
+    options["fields.cls"] = method
+    cosmo, shells = matter_setup(options)
+    kerns, norms = lensing_windows(options, cosmo, shells)
+    tile = set_jobs_tile(options, len(kerns), jobs)
+    check_tiles(len(kerns), tile, None, jobs=jobs)
+    cls = compute_cls(options, kerns, cosmo, setup=lensing_setup, tile=tile,
+                      jobs=jobs)
+    cls = scale_cls(cls, norms)
+    save_cls(path, cls, format=format, dtype=dtype, lmax=lmax,
+             compress=compress)
+    emit_output(path)
+    if record:
+        record_target(config, "lensing-cls", path)
+
+
+def check_format(format, compress):
+    if compress and format == "mmap":
+        raise click.BadParameter("memory-mapped Cls cannot be compressed",
+                                 param_hint="--compress")
+
+
+def lmax_auto_option(ctx, param, value):
+    if value is None or value == "auto":
+        return value
+    try:
+        lmax = int(value)
+    except ValueError:
+        lmax = -1
+    if lmax < 0:
+        raise click.BadParameter(f"expected a mode number or 'auto', "
+                                 f"got '{value}'")
+    return lmax
+
+
+def shard_option(ctx, param, value):
+    if value is None:
+        return None
+    k, sep, n = value.partition("/")
+    try:
+        k, n = int(k), int(n)
+    except ValueError:
+        k = n = 0
+    if not sep or not 1 <= k <= n:
+        raise click.BadParameter(f"expected K/N with 1 <= K <= N, "
+                                 f"got '{value}'")
+    return k, n
+
+
+def size_option(ctx, param, value):
+    from ._util import parse_size
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc)) from None
+
+
+@click.group()
+def cli():
+    """Compute and store simulation files."""
+
+
+@cli.command()
+@click.option("-f", "--force", is_flag=True,
+              help="Force writing over existing file.")
+@click.option("--resume", is_flag=True,
+              help="Resume from the checkpoint of an interrupted run "
+                   "(requires 'compute.cls.tile').")
+@click.option("--max-memory", metavar="SIZE", envvar="GLASS_MAX_MEMORY",
+              callback=size_option,
+              help="Refuse to run if the estimated peak memory exceeds "
+                   "SIZE, such as '500M' or '64G'.")
+@click.option("--shard", metavar="K/N", callback=shard_option,
+              help="Only compute shard K of N, for merging later.")
+@format_option
+@dtype_option
+@click.option("--lmax", metavar="L|auto", callback=lmax_auto_option,
+              help="Truncate the stored Cls at this mode, or 'auto' to "
+                   "compute them up to the mode where they converge.")
+@compress_option
+@jobs_option
+@pass_config
+def cls(config, force, resume, max_memory, shard, format, dtype, lmax,
+        compress, jobs):
+    """Compute and store angular matter power spectra.
+
+    With --shard K/N, only the K-th of N balanced parts of the Cls is
+    computed and written to a shard file next to the output path.  Once
+    all N shards exist, 'glass compute merge' writes the output file.
+
+    """
+    path = cls_path(config)
+    if shard is not None:
+        if lmax == "auto":
+            raise click.UsageError("--lmax auto cannot be used with --shard")
+        if (format, dtype, lmax, compress) != ("npz", "float64", None, False):
+            raise click.UsageError("storage options are given to "
+                                   "'glass compute merge' for shards")
+        spath = shard_path(config, path, shard)
+        if os.path.exists(spath) and not force:
+            raise click.ClickException(f"File '{spath}' exists "
+                                       "(use --force to overwrite)")
+        write_shard(config, path, shard, jobs=jobs, resume=resume,
+                    max_memory=max_memory)
+        return
     if os.path.exists(path) and not force:
         raise click.ClickException(f"File '{path}' exists "
                                    "(use --force to overwrite)")
-    config["fields.cls"] = method
-    cosmo = cosmo_from_config(config)
-    shells = shells_from_config(config, cosmo)
-    cls = cls_from_config(config, shells, cosmo)
-    save_cls(path, cls)
+    check_format(format, compress)
+    write_cls(config, path, format=format, dtype=dtype, lmax=lmax,
+              compress=compress, jobs=jobs, resume=resume,
+              max_memory=max_memory)
+
+
+@cli.command()
+@click.option("-f", "--force", is_flag=True,
+              help="Force writing over existing file.")
+@format_option
+@dtype_option
+@lmax_option
+@compress_option
+@click.argument("shards", nargs=-1,
+                type=click.Path(exists=True, dir_okay=False))
+@pass_config
+def merge(config, force, format, dtype, lmax, compress, shards):
+    """Merge shards of matter Cls into the output file.
+
+    The SHARDS are the files written by 'glass compute cls --shard'.  If
+    none are given, the shards of the configuration are found next to
+    the output path.  All shards must come from the same configuration.
+
+    """
+    path = cls_path(config)
+    if os.path.exists(path) and not force:
+        raise click.ClickException(f"File '{path}' exists "
+                                   "(use --force to overwrite)")
+    check_format(format, compress)
+    merge_cls(config, path, shards, format=format, dtype=dtype, lmax=lmax,
+              compress=compress)
 
 
 @cli.command()
 @pass_config
 @click.option("-f", "--force", is_flag=True,
               help="Force writing over existing file.")
-def lensing_cls(config, force):
+@format_option
+@dtype_option
+@lmax_option
+@compress_option
+@jobs_option
+def lensing_cls(config, force, format, dtype, lmax, compress, jobs):
     """Compute lensing spectra for plotting."""
-    import numpy as np
-    from glass.shells import RadialWindow
-    from ._plot import nearest_shell
-    method = compute_cls_method(config)
     path = config.getstr("plot.lensing.cls")
-    echo_method = click.style(method, bold=True, underline=True)
-    echo_path = click.style(path, bold=True, underline=True)
-    click.echo(f"Writing '{echo_method}' lensing Cls to '{echo_path}' ...")
     if os.path.exists(path) and not force:
         raise click.ClickException(f"File '{path}' exists "
                                    "(use --force to overwrite)")
-    config["fields.cls"] = method
-    cosmo = cosmo_from_config(config)
-    shells = shells_from_config(config, cosmo)
-    redshifts = config.getarray(float, "plot.lensing.redshifts")
-    norms = []
-    kerns = []
-    for i in nearest_shell(redshifts, shells):
-        zsrc = shells[i].zeff
-        z = np.linspace(0, zsrc, 1000)
-        w = (3*cosmo.omega_m/2*cosmo.xm(z)/cosmo.xm(zsrc)
-             * cosmo.xm(z, zsrc)*(1 + z)/cosmo.ef(z))
-        n = np.trapz(w, z)
-        w /= n
-        norms += [n]
-        kerns += [RadialWindow(za=z, wa=w, zeff=zsrc)]
-    cls = cls_from_config(config, kerns, cosmo)
-    icls = iter(cls)
-    n = len(norms)
-    cls = [norms[i]*norms[j]*next(icls)
-           for i in range(n) for j in range(i, -1, -1)]
-    save_cls(path, cls)
+    check_format(format, compress)
+    write_lensing_cls(config, path, format=format, dtype=dtype, lmax=lmax,
+                      compress=compress, jobs=jobs)
+
+
+@cli.command()
+@click.option("-f", "--force", is_flag=True,
+              help="Force writing over existing files.")
+@click.option("--dtype", type=click.Choice(["float64", "float32"]),
+              default="float64", show_default=True,
+              help="Data type of the written maps.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              show_default=True, help="Number of maps written in parallel.")
+@pass_config
+def maps(config, force, dtype, jobs):
+    """Generate and store a matter map for each shell.
+
+    Maps are sampled shell by shell and written to the path given by the
+    'compute.maps.path' option, in which '{index}' is replaced by the
+    number of the shell.  Paths ending in '.fits' are written as FITS,
+    all others in NumPy's format.  Only the last 'fields.ncorr' maps are
+    held in memory while sampling, and up to JOBS maps are written in
+    parallel threads.
+
+    """
+    from ._maps import generate_maps, map_paths, write_maps
+    from ._shells import matter_setup
+    cosmo, shells = matter_setup(config)
+    try:
+        paths = map_paths(config.getstr("compute.maps.path"), len(shells))
+    except ValueError as exc:
+        raise click.ClickException(str(exc)) from None
+    for path in paths:
+        if os.path.exists(path) and not force:
+            raise click.ClickException(f"File '{path}' exists "
+                                       "(use --force to overwrite)")
+    cls = cached_cls(config, shells, cosmo)
+    maps = generate_maps(config, shells, cls)
+    write_maps(maps, paths, dtype=dtype, jobs=jobs)
+
+
+@cli.command()
+@click.option("--json", "as_json", is_flag=True,
+              help="Write the estimates as JSON.")
+@jobs_option
+@pass_config
+def plan(config, as_json, jobs):
+    """Estimate the cost of computing Cls and making plots.
+
+    Nothing is computed.  Memory is estimated from the size of the data,
+    and wall time from the recorded timings of earlier runs.
+
+    """
+    from ._plan import make_plan
+    from ._util import format_duration, format_size
+    options = copy.deepcopy(config)
+    options["fields.cls"] = compute_cls_method(config)
+    estimates = make_plan(options, jobs=jobs)
+    if as_json:
+        import json
+        click.echo(json.dumps(estimates, indent=2))
+        return
+    click.echo(f"shells: {estimates['shells']}")
+    click.echo(f"pairs: {estimates['pairs']}")
+    click.echo(f"lmax: {estimates['lmax']}")
+    click.echo(f"output: {format_size(estimates['output'])}")
+    click.echo(f"cached: {'yes' if estimates['cached'] else 'no'}")
+    click.echo(f"workers: {estimates['workers']}")
+    for name, stage in estimates["stages"].items():
+        memory = format_size(stage["memory"])
+        if name == "compute cls" and estimates["cached"]:
+            wall = "cached"
+        elif stage["time"] is None:
+            wall = "unknown"
+        else:
+            wall = f"{format_duration(stage['time'])} ({stage['runs']} runs)"
+        click.echo(f"{name:<20} {memory:>8}   {wall}")
 
 
 if __name__ == "__main__":
@@ -2,16 +2,116 @@
 # license: MIT
 """Commands for dealing with config options."""
 
-import click
+from functools import update_wrapper
 
-from glass.ext.config import Config
+import click
 
+from ._profile import stage
+from ._progress import emit
 from ._util import get_resource
 
 DEFAULT_FILE = "default.ini"
 LOCAL_FILE = "glass.ini"
 
-pass_config = click.make_pass_decorator(Config)
+# key of the loaded config in the shared metadata of the contexts
+CONFIG_KEY = "glass.config"
+
+
+def config_args(ctx=None):
+    """Return the files, defaults flag, and overrides of the invocation."""
+    if ctx is None:
+        ctx = click.get_current_context()
+    params = ctx.find_root().params
+    return (tuple(params.get("config", ())),
+            params.get("no_defaults", False),
+            tuple(params.get("options", ())))
+
+
+def get_config(ctx=None):
+    """Return the config of the current invocation, loading it once."""
+    if ctx is None:
+        ctx = click.get_current_context()
+    config = ctx.meta.get(CONFIG_KEY)
+    if config is None:
+        files, no_defaults, overrides = config_args(ctx)
+        with stage("load_config"):
+            config = load_config(files, no_defaults=no_defaults,
+                                 overrides=overrides)
+        ctx.meta[CONFIG_KEY] = config
+        emit("config_loaded", command=command_name(ctx), files=list(files))
+    return config
+
+
+class LazyConfig:
+    """Stand-in for the config of an invocation, loaded on first use.
+
+    The root command sets this as the context object, so that commands
+    which use ``click.pass_obj`` or ``click.make_pass_decorator`` receive
+    the config, which is only loaded once they use it.  Checks with
+    :func:`isinstance` see the class of the loaded config.
+
+    """
+
+    def __init__(self, ctx):
+        self._ctx = ctx
+
+    def _load(self):
+        return get_config(self._ctx)
+
+    @property
+    def __class__(self):
+        return type(self._load())
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+
+    def __delitem__(self, key):
+        del self._load()[key]
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return repr(self._load())
+
+    def __copy__(self):
+        import copy
+        return copy.copy(self._load())
+
+    def __deepcopy__(self, memo):
+        import copy
+        return copy.deepcopy(self._load(), memo)
+
+
+def command_name(ctx):
+    """Return the name of the invoked command without the program."""
+    names = []
+    while ctx.parent is not None:
+        names.append(ctx.info_name)
+        ctx = ctx.parent
+    return " ".join(reversed(names))
+
+
+def pass_config(f):
+    """Decorator that passes the loaded config as first argument."""
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        config = get_config(ctx)
+        with stage(command_name(ctx)):
+            return ctx.invoke(f, config, *args, **kwargs)
+    return update_wrapper(new_func, f)
 
 
 def config_files():
@@ -24,8 +124,19 @@ def config_files():
     return files
 
 
-def load_config(files, *, no_defaults=False):
+def parse_override(override):
+    """Split a 'section.key=value' override into its parts."""
+    name, eq, value = override.partition("=")
+    section, dot, key = name.strip().partition(".")
+    if not eq or not dot or not section or not key:
+        raise click.BadParameter(f"expected 'section.key=value', got "
+                                 f"'{override}'")
+    return section, key, value.strip()
+
+
+def load_config(files, *, no_defaults=False, overrides=()):
     from configparser import ConfigParser, ExtendedInterpolation
+    from glass.ext.config import Config
     parser = ConfigParser(interpolation=ExtendedInterpolation())
     parser.optionxform = lambda obj: obj
     if not no_defaults:
@@ -33,6 +144,9 @@ def load_config(files, *, no_defaults=False):
     for file in files:
         with open(file) as fp:
             parser.read_file(fp)
+    for override in overrides:
+        section, key, value = parse_override(override)
+        parser.read_dict({section: {key: value}})
     options = {f"{section}.{key}": parser[section][key]
                for section in parser for key in parser[section]}
     return Config(options)
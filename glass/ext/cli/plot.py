@@ -2,78 +2,329 @@
 # license: MIT
 """Commands for making various plots."""
 
+import time
+
 import click
 
+from ._profile import stage
 from .config import pass_config
 
+PLOTS = ("shells", "correlations", "lensing")
+
+
+def shells_figure(config, cosmo, shells, cls, preview=False):
+    from ._plot import plot_shells
+    return plot_shells(shells)
+
+
+def correlations_figure(config, cosmo, shells, cls, preview=False):
+    from ._plot import plot_correlations
+    accuracy = config.getfloat("plot.accuracy", 1e-2)
+    return plot_correlations(shells, cls, accuracy=accuracy)
+
+
+def lensing_figure(config, cosmo, shells, cls, preview=False):
+    from ._build import warn_if_stale
+    from ._cls import load_cls
+    from ._plot import plot_lensing
+    from ._shells import lensing_matrix
+    redshifts = config.getarray(float, "plot.lensing.redshifts")
+    if preview:
+        from ._preview import preview_lensing_cls
+        lensing_cls = preview_lensing_cls(config, shells, cosmo)
+    else:
+        path = config.getstr("plot.lensing.cls")
+        warn_if_stale(config, "lensing-cls", path)
+        lensing_cls = load_cls(path)
+    accuracy = config.getfloat("plot.accuracy", 1e-2)
+    samples = config.getint("compute.lensing.samples", None)
+    lmat = lensing_matrix(config, shells, cosmo)
+    return plot_lensing(redshifts, shells, cosmo, cls, lensing_cls,
+                        accuracy=accuracy, samples=samples, lmat=lmat)
+
+
+FIGURES = {
+    "shells": shells_figure,
+    "correlations": correlations_figure,
+    "lensing": lensing_figure,
+}
+
+
+def make_figures(config, names, *, interactive=True, preview=False):
+    """Build the shared inputs once and yield the named figures.
+
+    If not *interactive*, a non-interactive backend is used.  If
+    *preview* is true, the figures are made from approximate Cls and
+    marked as such.
+
+    """
+    if not interactive:
+        import matplotlib
+        matplotlib.use("agg")
+    from ._cache import cached_cls
+    from ._plan import record_timing
+    from ._plot import use_style, watermark
+    from ._shells import matter_setup
+    use_style()
+    cosmo, shells = matter_setup(config)
+    cls = None
+    if any(name != "shells" for name in names):
+        if preview:
+            from ._preview import preview_cls
+            with stage("preview_cls"):
+                cls = preview_cls(config, shells, cosmo)
+        else:
+            if config.getstr("fields.cls", None) == "load":
+                from ._build import warn_if_stale
+                warn_if_stale(config, "cls", config.getstr("fields.cls.path"))
+            cls = cached_cls(config, shells, cosmo)
+    for name in names:
+        start = time.perf_counter()
+        with stage(f"plot_{name}"):
+            fig = FIGURES[name](config, cosmo, shells, cls, preview)
+        if preview:
+            if name != "shells":
+                watermark(fig, "approximate")
+        else:
+            record_timing(config, f"plot {name}", 1,
+                          time.perf_counter() - start)
+        yield name, fig
+
+
+def export_figure(fig, paths):
+    """Save a figure to each of *paths*, laying it out only once.
+
+    The layout and the tight bounding box are computed once, at the
+    resolution used for saving, and then fixed for all output formats.
+
+    """
+    import matplotlib as mpl
+    dpi = mpl.rcParams["savefig.dpi"]
+    with stage("layout"):
+        if dpi != "figure":
+            fig_dpi, fig.dpi = fig.dpi, dpi
+        fig.draw_without_rendering()
+        bbox = fig.get_tightbbox().padded(mpl.rcParams["savefig.pad_inches"])
+        fig.set_layout_engine("none")
+        if dpi != "figure":
+            fig.dpi = fig_dpi
+    for path in paths:
+        with stage("savefig", path=path):
+            fig.savefig(path, bbox_inches=bbox)
+
+
+def save_figure(fig, paths):
+    """Save a figure to each of *paths* and close it."""
+    import matplotlib.pyplot as plt
+    export_figure(fig, paths)
+    plt.close(fig)
+
+
+class FigureWriter:
+    """Save figures in up to *jobs* forked processes.
+
+    Matplotlib is not thread-safe, so figures are not saved on threads.
+    Instead, a forked process inherits a copy of each figure and saves it
+    while the next figure is made.  With a single job, or where fork is
+    not available, each figure is saved in this process when it is
+    submitted.  Figures are closed in this process once submitted.
+
+    """
+
+    def __init__(self, jobs=1):
+        import multiprocessing
+        if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+            self.ctx = multiprocessing.get_context("fork")
+        else:
+            self.ctx = None
+        self.jobs = jobs
+        self.running = []
+        self.failed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+        if exc_type is None and self.failed:
+            raise click.ClickException(f"could not save "
+                                       f"{'; '.join(self.failed)}")
+
+    def submit(self, fig, paths):
+        import matplotlib.pyplot as plt
+        try:
+            if self.ctx is None:
+                try:
+                    export_figure(fig, paths)
+                except (OSError, ValueError) as exc:
+                    self.failed.append(f"{', '.join(paths)} ({exc})")
+                return
+            if len(self.running) >= self.jobs:
+                self.join(self.running.pop(0))
+            proc = self.ctx.Process(target=export_figure, args=(fig, paths),
+                                    name=", ".join(paths))
+            proc.start()
+            self.running.append(proc)
+        finally:
+            plt.close(fig)
+
+    def join(self, proc):
+        proc.join()
+        if proc.exitcode != 0:
+            self.failed.append(proc.name)
+
+    def wait(self):
+        """Wait for all forked processes to finish saving."""
+        while self.running:
+            self.join(self.running.pop(0))
+
+
+def output_paths(paths, formats=None):
+    """Return the output paths for *paths* in each of *formats*.
+
+    Each format replaces the extension of every path.  Without formats,
+    the paths are returned unchanged.
+
+    """
+    import os.path
+    if not formats:
+        return list(paths)
+    return [f"{os.path.splitext(path)[0]}.{format}"
+            for path in paths for format in formats]
+
+
+def parse_formats(ctx, param, value):
+    if value is None:
+        return None
+    return [format.strip().lstrip(".") for format in value.split(",")
+            if format.strip()]
+
+
+preview_option = click.option("--preview", is_flag=True,
+                              help="Plot approximate Cls, which are fast "
+                                   "to compute.")
+
+formats_option = click.option("-F", "--format", "formats", metavar="LIST",
+                              callback=parse_formats,
+                              help="Comma-separated list of file formats, "
+                                   "such as 'png,pdf'.")
+
+
+def make_plot(config, name, paths, preview=False):
+    """Make a single plot, and show it or save it to *paths*."""
+    import matplotlib.pyplot as plt
+    figures = make_figures(config, [name], interactive=not paths,
+                           preview=preview)
+    if not paths:
+        list(figures)
+        plt.show()
+        return
+    with FigureWriter() as writer:
+        for _, fig in figures:
+            click.echo(f"Saving '{name}' plot to '{', '.join(paths)}' ...")
+            writer.submit(fig, paths)
+
+
+def figure_path(template, name):
+    """Return the output path for a named figure from a template."""
+    import os.path
+    if "{name}" not in template:
+        root, ext = os.path.splitext(template)
+        template = f"{root}-{{name}}{ext}"
+    return template.format(name=name)
+
+
+def save_figures(figures, template, formats=None, jobs=1):
+    """Save figures, in up to *jobs* forked processes if possible.
+
+    Each figure is saved to the path given by *template* in each of
+    *formats*.
+
+    """
+    with FigureWriter(jobs) as writer:
+        for name, fig in figures:
+            paths = output_paths([figure_path(template, name)], formats)
+            click.echo(f"Saving '{name}' plot to '{', '.join(paths)}' ...")
+            writer.submit(fig, paths)
+
 
 @click.group()
 def cli():
-    """Generate various diagnostic plots."""
+    """Generate various diagnostic plots.
+
+    Each plot is shown, or saved to every PATH that is given.  With the
+    --format option, each PATH is saved in every format of the list.
+    With the --preview option, plots are made from approximate Cls in
+    the Limber approximation, which only take seconds to compute, and
+    are marked as approximate.
+
+    """
 
 
 @cli.command()
-@click.argument("path", type=click.Path(writable=True), required=False)
+@click.argument("paths", nargs=-1, type=click.Path(writable=True))
+@formats_option
 @pass_config
-def shells(config, path):
+def shells(config, paths, formats):
     """Plot shells."""
-    import matplotlib.pyplot as plt
-    from glass.ext.config import cosmo_from_config, shells_from_config
-    from ._plot import use_style, plot_shells
-    use_style()
-    cosmo = cosmo_from_config(config)
-    shells = shells_from_config(config, cosmo)
-    fig = plot_shells(shells)
-    if path:
-        fig.savefig(path, bbox_inches="tight")
-        plt.close()
-    else:
-        plt.show()
+    make_plot(config, "shells", output_paths(paths, formats))
 
 
 @cli.command()
-@click.argument("path", type=click.Path(writable=True), required=False)
+@click.argument("paths", nargs=-1, type=click.Path(writable=True))
+@formats_option
+@preview_option
 @pass_config
-def correlations(config, path):
+def correlations(config, paths, formats, preview):
     """Plot correlations between shells."""
-    import matplotlib.pyplot as plt
-    from glass.ext.config import (cls_from_config, cosmo_from_config,
-                                  shells_from_config)
-    from ._plot import use_style, plot_correlations
-    use_style()
-    cosmo = cosmo_from_config(config)
-    shells = shells_from_config(config, cosmo)
-    cls = cls_from_config(config, shells, cosmo)
-    accuracy = config.getfloat("plot.accuracy", 1e-2)
-    fig = plot_correlations(shells, cls, accuracy=accuracy)
-    if path:
-        fig.savefig(path, bbox_inches="tight")
-        plt.close()
-    else:
-        plt.show()
+    make_plot(config, "correlations", output_paths(paths, formats), preview)
 
 
 @cli.command()
-@click.argument("path", type=click.Path(writable=True), required=False)
+@click.argument("paths", nargs=-1, type=click.Path(writable=True))
+@formats_option
+@preview_option
 @pass_config
-def lensing(config, path):
+def lensing(config, paths, formats, preview):
     """Plot lensing accuracy."""
+    make_plot(config, "lensing", output_paths(paths, formats), preview)
+
+
+@cli.command("all")
+@click.option("--only", help="Comma-separated list of plots to make.")
+@formats_option
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help="Number of processes for saving figures.")
+@preview_option
+@click.argument("path", required=False)
+@pass_config
+def all_(config, only, formats, jobs, preview, path):
+    """Make all plots, building shared inputs once.
+
+    If PATH is given, each plot is saved to PATH with '{name}' replaced
+    by the name of the plot, or with the name appended to the file name
+    if PATH does not contain '{name}'.  With --jobs, figures are saved in
+    forked processes while the next plot is made.
+
+    """
     import matplotlib.pyplot as plt
-    from glass.user import load_cls
-    from glass.ext.config import (cls_from_config, cosmo_from_config,
-                                  shells_from_config)
-    from ._plot import use_style, plot_lensing
-    use_style()
-    cosmo = cosmo_from_config(config)
-    shells = shells_from_config(config, cosmo)
-    redshifts = config.getarray(float, "plot.lensing.redshifts")
-    matter_cls = cls_from_config(config, shells, cosmo)
-    lensing_cls = load_cls(config.getstr("plot.lensing.cls"))
-    accuracy = config.getfloat("plot.accuracy", 1e-2)
-    fig = plot_lensing(redshifts, shells, cosmo, matter_cls, lensing_cls,
-                       accuracy=accuracy)
+    if only is None:
+        names = list(PLOTS)
+    else:
+        names = [name.strip() for name in only.split(",") if name.strip()]
+        for name in names:
+            if name not in PLOTS:
+                raise click.BadParameter(f"unknown plot '{name}'",
+                                         param_hint="--only")
+    figures = make_figures(config, names, interactive=not path,
+                           preview=preview)
     if path:
-        fig.savefig(path, bbox_inches="tight")
-        plt.close()
+        save_figures(figures, path, formats, jobs)
     else:
+        list(figures)
         plt.show()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,47 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Command for running a command server."""
+
+import click
+
+
+@click.command()
+@click.option("--socket", "path", metavar="PATH", envvar="GLASS_SOCKET",
+              help="Path of the server socket.")
+def cli(path):
+    """Run commands sent by 'glass --server' in a long-lived process.
+
+    Commands run one at a time in this process, which keeps the GLASS
+    modules imported, and the cosmology, shells, and the most recent Cls
+    in memory, so that repeated commands do not initialise them again.
+    The server runs until it is interrupted or terminated.
+
+    """
+    import signal
+    import matplotlib
+    from ._serve import serve, socket_path
+
+    # plots are only ever saved by the server
+    matplotlib.use("agg")
+
+    # import the modules used by commands before the first request
+    import glass.ext.config  # noqa: F401
+    from . import _plot, compute, plot  # noqa: F401
+
+    if path is None:
+        path = socket_path()
+
+    def terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    click.echo(f"Serving on '{path}' ...")
+    try:
+        serve(path)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
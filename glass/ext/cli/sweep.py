@@ -0,0 +1,136 @@
+# author: Nicolas Tessore <n.tessore@ucl.ac.uk>
+# license: MIT
+"""Command for running parameter sweeps."""
+
+import click
+
+from .config import config_args
+
+SWEEP_TARGETS = ("cls", "lensing-cls")
+
+
+def parse_param(param):
+    """Split a 'key=v1,v2,...' grid parameter into key and values."""
+    key, eq, values = param.partition("=")
+    values = [value.strip() for value in values.split(",") if value.strip()]
+    if not eq or "." not in key or not values:
+        raise click.BadParameter(f"expected 'section.key=v1,v2,...', got "
+                                 f"'{param}'", param_hint="--param")
+    return key.strip(), values
+
+
+def point_path(template, index, point):
+    """Return the output path of a sweep point from a template.
+
+    The template can contain '{index}' and '{section.key}' for every
+    swept option.
+
+    """
+    import re
+    values = {"index": str(index), **point}
+
+    def replace(match):
+        name = match.group(1)
+        if name not in values:
+            raise click.BadParameter(f"unknown field '{{{name}}}'",
+                                     param_hint="TEMPLATE")
+        return values[name]
+
+    return re.sub(r"\{([^{}]+)\}", replace, template)
+
+
+def run_points(args, target, points, format):
+    """Compute the target for a batch of sweep points in this process."""
+    from .compute import write_cls, write_lensing_cls
+    from .config import load_config
+    files, no_defaults, overrides = args
+    write = write_cls if target == "cls" else write_lensing_cls
+    for path, point in points:
+        extra = tuple(f"{key}={value}" for key, value in point.items())
+        config = load_config(files, no_defaults=no_defaults,
+                             overrides=overrides + extra)
+        # points are not build targets and must not touch the build state
+        write(config, path, format=format, record=False)
+    return len(points)
+
+
+@click.command()
+@click.option("-p", "--param", "params", metavar="KEY=V1,V2,...",
+              multiple=True, required=True,
+              help="Option and its values to sweep (can be repeated).")
+@click.option("-t", "--target", type=click.Choice(SWEEP_TARGETS),
+              default="cls", show_default=True,
+              help="What to compute for each point.")
+@click.option("--format", type=click.Choice(["npz", "mmap"]),
+              default="npz", show_default=True,
+              help="File format of the Cls.")
+@click.option("-f", "--force", is_flag=True,
+              help="Recompute points whose output exists.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              show_default=True, help="Number of parallel processes.")
+@click.argument("template")
+def cli(params, target, format, force, jobs, template):
+    """Compute Cls over a grid of configuration options.
+
+    Every combination of the swept options is a point of the grid.  The
+    output for each point is written to TEMPLATE, in which '{index}' and
+    '{section.key}' for each swept option are replaced.
+
+    Points are run in a pool of worker processes.  Points that share
+    their 'cosmo' and 'shells' options run in the same worker, so that
+    the cosmology and shells are only built once.
+
+    """
+    import itertools
+    import os.path
+    from ._util import config_hash
+    from .config import load_config
+
+    grid = dict(parse_param(param) for param in params)
+    args = config_args()
+
+    points = []
+    for index, values in enumerate(itertools.product(*grid.values())):
+        point = dict(zip(grid, values))
+        points.append((point_path(template, index, point), point))
+
+    paths = [path for path, _ in points]
+    if len(set(paths)) < len(paths):
+        raise click.BadParameter("does not give a unique path for every "
+                                 "point", param_hint="TEMPLATE")
+
+    groups = {}
+    for path, point in points:
+        if os.path.exists(path) and not force:
+            click.echo(f"Skipping '{path}' (exists)")
+            continue
+        files, no_defaults, overrides = args
+        extra = tuple(f"{key}={value}" for key, value in point.items())
+        config = load_config(files, no_defaults=no_defaults,
+                             overrides=overrides + extra)
+        key = config_hash(config, ("cosmo", "shells"))
+        groups.setdefault(key, []).append((path, point))
+
+    # split groups into batches until there is work for every process
+    batches = list(groups.values())
+    while len(batches) < jobs and any(len(b) > 1 for b in batches):
+        batches.sort(key=len)
+        largest = batches.pop()
+        half = len(largest)//2
+        batches += [largest[:half], largest[half:]]
+
+    if jobs == 1 or len(batches) <= 1:
+        for batch in batches:
+            run_points(args, target, batch, format)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(min(jobs, len(batches))) as pool:
+        futures = [pool.submit(run_points, args, target, batch, format)
+                   for batch in batches]
+        for future in futures:
+            future.result()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,102 @@
+import pytest
+
+from glass.ext.cli._build import record, stale
+
+MISSING = object()
+
+
+class Config(dict):
+    """Minimal stand-in for the configuration of the CLI."""
+
+    def getstr(self, key, default=MISSING):
+        if key not in self:
+            if default is MISSING:
+                raise KeyError(key)
+            return default
+        return self[key]
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return Config({"cosmo.h": "0.7", "fields.lmax": "100",
+                   "fields.cls": "load", "fields.cls.path": "cls.npz",
+                   "plot.accuracy": "0.01"})
+
+
+def write(path, data):
+    with open(path, "w") as fp:
+        fp.write(data)
+
+
+def test_stale(config):
+    assert stale(config, "cls", "cls.npz") == "output missing"
+    write("cls.npz", "x")
+    assert stale(config, "cls", "cls.npz") == "no record"
+    record(config, "cls", "cls.npz")
+    assert stale(config, "cls", "cls.npz") is None
+    assert stale(config, "cls", "other.npz") == "output missing"
+
+    # options that the target does not depend on
+    changed = Config(config, **{"plot.accuracy": "0.1"})
+    assert stale(changed, "cls", "cls.npz") is None
+    changed = Config(config, **{"fields.lmax": "200"})
+    assert stale(changed, "cls", "cls.npz") == "configuration changed"
+
+    write("cls.npz", "xy")
+    assert stale(config, "cls", "cls.npz") == "output modified"
+
+
+def test_stale_inputs(config):
+    write("cls.npz", "x")
+    write("corr.png", "x")
+    assert stale(config, "correlations", "corr.png") == "no record"
+    computed = Config(config, **{"fields.cls": "camb"})
+    record(computed, "correlations", "corr.png")
+    assert stale(config, "correlations", "corr.png") == (
+        "configuration changed")
+    record(config, "cls", "cls.npz")
+    record(config, "correlations", "corr.png")
+    assert stale(config, "correlations", "corr.png") is None
+
+    write("cls.npz", "xy")
+    record(config, "cls", "cls.npz")
+    assert stale(config, "correlations", "corr.png") == "input 'cls' changed"
+
+    # without loading Cls, the plot does not read the file
+    record(computed, "correlations", "corr.png")
+    write("cls.npz", "xyz")
+    record(computed, "cls", "cls.npz")
+    assert stale(computed, "correlations", "corr.png") is None
+
+
+def test_dry_run_propagates(config, monkeypatch):
+    pytest.importorskip("glass.ext.config")
+    from click.testing import CliRunner
+    import glass.ext.cli.config as cli_config
+    from glass.ext.cli.build import cli
+
+    def options(*overrides):
+        base = ("fields.cls=load", "fields.cls.path=cls.npz",
+                "compute.cls=camb", "plot.correlations.path=corr.png")
+        monkeypatch.setattr(cli_config, "config_args",
+                            lambda ctx=None: ((), True, base + overrides))
+        return cli_config.load_config((), no_defaults=True,
+                                      overrides=base + overrides)
+
+    loaded = options()
+    write("cls.npz", "x")
+    write("corr.png", "x")
+    record(loaded, "cls", "cls.npz")
+    record(loaded, "correlations", "corr.png")
+
+    result = CliRunner().invoke(cli, ["-n", "cls", "correlations"])
+    assert result.exit_code == 0, result.output
+    assert "'correlations' is up to date" in result.output
+
+    options("compute.cls.tile=4")
+    result = CliRunner().invoke(cli, ["-n", "cls", "correlations"])
+    assert result.exit_code == 0, result.output
+    assert "'cls' needs rebuilding: configuration changed" in result.output
+    assert ("'correlations' needs rebuilding: input 'cls' is rebuilt"
+            in result.output)
@@ -0,0 +1,59 @@
+from glass.ext.cli._cache import cls_key
+
+MISSING = object()
+
+
+class Config(dict):
+    """Minimal stand-in for the configuration of the CLI."""
+
+    def getstr(self, key, default=MISSING):
+        if key not in self:
+            if default is MISSING:
+                raise KeyError(key)
+            return default
+        return self[key]
+
+    def getint(self, key, default=MISSING):
+        value = self.getstr(key, default)
+        return value if value is default else int(value)
+
+
+def make_config(**options):
+    config = Config({
+        "cosmo.h": "0.7",
+        "shells.grid.zmax": "2.0",
+        "fields.lmax": "100",
+        "fields.cls": "camb",
+    })
+    config.update((key.replace("__", "."), str(value))
+                  for key, value in options.items())
+    return config
+
+
+def test_cls_key_ignores_other_sections():
+    key = cls_key(make_config(), 10)
+    assert cls_key(make_config(plot__accuracy=0.1), 10) == key
+    assert cls_key(make_config(cosmo__h=0.6), 10) != key
+
+
+def test_cls_key_tile():
+    key = cls_key(make_config(), 10)
+    # a single tile is the same as no tile
+    assert cls_key(make_config(compute__cls__tile=10), 10) == key
+    assert cls_key(make_config(compute__cls__tile=0), 10) == key
+    tiled = cls_key(make_config(compute__cls__tile=4), 10)
+    assert tiled != key
+    assert cls_key(make_config(compute__cls__tile=5), 10) != tiled
+    # the number of shells decides whether the tile is effective
+    assert cls_key(make_config(compute__cls__tile=4), 4) == cls_key(
+        make_config(), 4)
+
+
+def test_cls_key_bandwidth():
+    key = cls_key(make_config(compute__cls__bandwidth=3), 10)
+    assert key != cls_key(make_config(), 10)
+    # the tile defaults to the bandwidth
+    assert cls_key(make_config(compute__cls__bandwidth=3,
+                               compute__cls__tile=3), 10) == key
+    assert cls_key(make_config(compute__cls__bandwidth=3,
+                               compute__cls__tile=5), 10) != key
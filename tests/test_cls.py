@@ -0,0 +1,262 @@
+import numpy as np
+import pytest
+
+from glass.ext.cli._cls import (cls_pairs, jobs_tile, merge_shards,
+                                save_shard, shard_tasks, tile_tasks)
+
+
+def band(n, bandwidth):
+    return [(i, j) for i, j in cls_pairs(n)
+            if bandwidth is None or i - j <= bandwidth]
+
+
+@pytest.mark.parametrize("n, tile, bandwidth", [
+    (1, None, None),
+    (7, None, None),
+    (7, 7, None),
+    (7, 1, None),
+    (7, 3, None),
+    (10, 4, None),
+    (10, None, 2),
+    (10, 3, 2),
+    (10, 4, 1),
+    (10, None, 0),
+    (10, 2, 5),
+])
+def test_tile_tasks(n, tile, bandwidth):
+    tasks = tile_tasks(n, tile, bandwidth)
+    pairs = [pair for _, task_pairs in tasks for pair in task_pairs]
+    assert sorted(pairs) == sorted(band(n, bandwidth))
+    for shells, task_pairs in tasks:
+        assert list(shells) == sorted(set(shells))
+        assert all(i in shells and j in shells for i, j in task_pairs)
+
+
+@pytest.mark.parametrize("shards", [1, 2, 3, 6])
+def test_shard_tasks(shards):
+    tasks = tile_tasks(12, 3)
+    indices = [i for k in range(1, shards+1)
+               for i, _ in shard_tasks(tasks, k, shards)]
+    assert sorted(indices) == list(range(len(tasks)))
+
+
+def fake_cls(pairs):
+    return {(i, j): np.arange(5.) + 100*i + j for i, j in pairs}
+
+
+@pytest.mark.parametrize("tile, bandwidth", [(3, None), (None, 2)])
+def test_shards_round_trip(tmp_path, tile, bandwidth):
+    n, count = 9, 3
+    tasks = tile_tasks(n, tile, bandwidth)
+    paths = []
+    for k in range(1, count+1):
+        pairs = [pair for _, task in shard_tasks(tasks, k, count)
+                 for pair in task[1]]
+        path = tmp_path / f"shard-{k}.npz"
+        save_shard(path, fake_cls(pairs), key="abc", shard=(k, count),
+                   shells=n, bandwidth=bandwidth)
+        paths.append(path)
+
+    key, cls = merge_shards(paths)
+    assert key == "abc"
+    expected = fake_cls(band(n, bandwidth))
+    assert len(cls) == n*(n+1)//2
+    for pair, cl in zip(cls_pairs(n), cls):
+        if pair in expected:
+            np.testing.assert_array_equal(cl, expected[pair])
+        else:
+            assert len(cl) == 0
+
+    with pytest.raises(ValueError, match="missing shards"):
+        merge_shards(paths[1:])
+    with pytest.raises(ValueError, match="more than once"):
+        merge_shards(paths + paths[:1])
+
+
+@pytest.mark.parametrize("n", [3, 4, 10, 35, 100])
+@pytest.mark.parametrize("jobs", [2, 3, 4, 8, 32])
+def test_jobs_tile(n, jobs):
+    tile = jobs_tile(n, jobs)
+    tasks = tile_tasks(n, tile)
+    assert len(tasks) >= min(jobs, n*(n-1)//2)
+    # one tile more would give fewer tasks than jobs
+    if tile < n - 1 and tile > 1:
+        blocks = -(-n//tile)
+        assert (blocks-1)*(blocks-2)//2 < jobs
+
+
+def test_check_tiles():
+    import click
+    from glass.ext.cli.compute import check_tiles
+    check_tiles(35, 12, None, jobs=4, resume=True)
+    check_tiles(35, None, None)
+    # a tile of at least half the shells gives a single task
+    with pytest.raises(click.UsageError, match="--jobs"):
+        check_tiles(35, 20, None, jobs=4)
+    with pytest.raises(click.UsageError, match="--resume"):
+        check_tiles(35, 20, None, resume=True)
+    with pytest.raises(click.UsageError, match="--jobs"):
+        check_tiles(3, 2, None, jobs=2)
+
+
+@pytest.fixture
+def fake_matter_cls(monkeypatch):
+    """Replace the Cls of windows by their shell numbers, counting calls."""
+    import glass.ext.cli._cls as _cls
+    calls = []
+
+    def matter_cls(config, windows, cosmo):
+        calls.append(tuple(windows))
+        return [np.array([100.*wi + wj]) for i, wi in enumerate(windows)
+                for wj in windows[i::-1]]
+
+    monkeypatch.setattr(_cls, "matter_cls", matter_cls)
+    return calls
+
+
+def test_checkpoint_resume(tmp_path, fake_matter_cls):
+    from glass.ext.cli._cls import compute_cls
+    n = 9
+    checkpoint = tmp_path / "ckpt"
+    windows = list(range(n))
+    cls = compute_cls({}, windows, None, setup=None, tile=3,
+                      checkpoint=checkpoint)
+    tasks = len(fake_matter_cls)
+    assert tasks == len(tile_tasks(n, 3)) > 1
+    assert len(list(checkpoint.glob("task-*.npz"))) == tasks
+    for (i, j), cl in zip(cls_pairs(n), cls):
+        assert cl[0] == 100*i + j
+
+    # resuming with all tasks done computes nothing
+    fake_matter_cls.clear()
+    resumed = compute_cls({}, windows, None, setup=None, tile=3,
+                          checkpoint=checkpoint, resume=True)
+    assert fake_matter_cls == []
+    assert all(np.array_equal(a, b) for a, b in zip(cls, resumed))
+
+    # resuming recomputes only the missing task
+    sorted(checkpoint.glob("task-*.npz"))[1].unlink()
+    resumed = compute_cls({}, windows, None, setup=None, tile=3,
+                          checkpoint=checkpoint, resume=True)
+    assert len(fake_matter_cls) == 1
+    assert all(np.array_equal(a, b) for a, b in zip(cls, resumed))
+
+    # without resume, the checkpoint is started anew
+    fake_matter_cls.clear()
+    compute_cls({}, windows, None, setup=None, tile=3, checkpoint=checkpoint)
+    assert len(fake_matter_cls) == tasks
+
+
+def test_checkpoint_single_task(tmp_path, fake_matter_cls):
+    from glass.ext.cli._cls import compute_cls
+    checkpoint = tmp_path / "ckpt"
+    with pytest.warns(UserWarning, match="no checkpoint"):
+        compute_cls({}, list(range(4)), None, setup=None,
+                    checkpoint=checkpoint, resume=True)
+    assert not checkpoint.exists()
+
+
+def test_worker_stages(fake_matter_cls):
+    from glass.ext.cli import _profile
+    from glass.ext.cli._cls import _init_worker, _run_task
+
+    def setup(config):
+        with _profile.stage("setup"):
+            return None, list(range(6))
+
+    _profile.enable()
+    try:
+        origin = _profile.origin()
+        _init_worker(setup, {}, origin)
+        assert _profile.origin() == origin
+        tasks = tile_tasks(6, 2)
+        _, _, records = _run_task(tasks[0])
+        assert [r["name"] for r in records] == ["setup", "cls_from_config"]
+        _, _, records = _run_task(tasks[1])
+        assert [r["name"] for r in records] == ["cls_from_config"]
+        _profile.merge(records)
+        assert _profile.collect() == records
+    finally:
+        _profile.disable()
+    assert _profile.origin() is None
+
+
+def random_cls(n, size=6, bandwidth=None, seed=1):
+    rng = np.random.default_rng(seed)
+    return [rng.random(size) if bandwidth is None or i - j <= bandwidth
+            else np.empty(0) for i, j in cls_pairs(n)]
+
+
+@pytest.mark.parametrize("bandwidth", [None, 1])
+def test_cls_file(tmp_path, bandwidth):
+    from glass.ext.cli._cls import ClsFile, load_cls, save_cls
+    n = 5
+    cls = random_cls(n, bandwidth=bandwidth)
+    path = tmp_path / "cls.mmap"
+    save_cls(path, cls, format="mmap")
+    loaded = load_cls(path)
+    assert isinstance(loaded, ClsFile)
+    assert len(loaded) == len(cls)
+    for a, b in zip(cls, loaded):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(loaded[-1], cls[-1])
+    assert [len(cl) for cl in loaded[1:4]] == [len(cl) for cl in cls[1:4]]
+    with pytest.raises(IndexError):
+        loaded[len(cls)]
+    for i, j in (3, 2), (2, 3), (4, 4):
+        k = i*(i+1)//2 + i - j if i >= j else j*(j+1)//2 + j - i
+        np.testing.assert_array_equal(loaded.cl(i, j), cls[k])
+        np.testing.assert_array_equal(loaded.cl(i, j, 2), cls[k][:3])
+
+
+@pytest.mark.parametrize("format", ["npz", "mmap"])
+@pytest.mark.parametrize("bandwidth", [None, 1])
+def test_save_cls_options(tmp_path, format, bandwidth):
+    from glass.ext.cli._cls import load_cls, save_cls
+    cls = random_cls(5, bandwidth=bandwidth)
+    path = tmp_path / f"cls.{format}"
+    save_cls(path, cls, format=format, dtype="f4", lmax=3)
+    loaded = list(load_cls(path))
+    assert len(loaded) == len(cls)
+    for a, b in zip(cls, loaded):
+        assert b.dtype == np.float64
+        assert len(b) == min(len(a), 4)
+        np.testing.assert_array_equal(b, a[:4].astype(np.float32))
+
+
+def test_save_cls_compress(tmp_path):
+    import zipfile
+    from glass.ext.cli._cls import load_cls, save_cls
+    cls = random_cls(4)
+    path = tmp_path / "cls.npz"
+    save_cls(path, cls, compress=True)
+    with zipfile.ZipFile(path) as zf:
+        assert all(info.compress_type == zipfile.ZIP_DEFLATED
+                   for info in zf.infolist())
+    for a, b in zip(cls, load_cls(path)):
+        np.testing.assert_array_equal(a, b)
+    with pytest.raises(ValueError, match="compressed"):
+        save_cls(tmp_path / "cls.mmap", cls, format="mmap", compress=True)
+    with pytest.raises(ValueError, match="unknown"):
+        save_cls(tmp_path / "cls.txt", cls, format="txt")
+
+
+@pytest.mark.parametrize("format", ["npz", "mmap"])
+def test_cls_meta(tmp_path, format):
+    from glass.ext.cli._cls import load_cls, load_meta, save_cls
+    cls = random_cls(3)
+    meta = {"lmax": 4, "error": 1e-3, "tolerance": 1e-2}
+    save_cls(tmp_path / "meta", cls, format=format, meta=meta)
+    save_cls(tmp_path / "none", cls, format=format)
+    assert load_meta(tmp_path / "meta") == meta
+    assert load_meta(tmp_path / "none") == {}
+    for a, b in zip(cls, load_cls(tmp_path / "meta")):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_scale_cls():
+    from glass.ext.cli._cls import scale_cls
+    norms = [1., 2., 3.]
+    cls = scale_cls(random_cls(3), norms)
+    for (i, j), cl, cl0 in zip(cls_pairs(3), cls, random_cls(3)):
+        np.testing.assert_array_equal(cl, norms[i]*norms[j]*cl0)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+MISSING = object()
+
+
+class Config(dict):
+    """Minimal stand-in for the configuration of the CLI."""
+
+    def getstr(self, key, default=MISSING):
+        if key not in self:
+            if default is MISSING:
+                raise KeyError(key)
+            return default
+        return self[key]
+
+    def getint(self, key, default=MISSING):
+        value = self.getstr(key, default)
+        return value if value is default else int(value)
+
+    def getfloat(self, key, default=MISSING):
+        value = self.getstr(key, default)
+        return value if value is default else float(value)
+
+
+@pytest.fixture
+def probe_cls(monkeypatch):
+    """Replace the Cls by power laws up to 'fields.lmax', counting calls."""
+    import glass.ext.cli._cls as _cls
+    calls = []
+
+    def matter_cls(config, windows, cosmo):
+        calls.append(tuple(windows))
+        l = np.arange(config.getint("fields.lmax") + 1)
+        return [(l + 1.)**-4 for i, wi in enumerate(windows)
+                for wj in windows[i::-1]]
+
+    monkeypatch.setattr(_cls, "matter_cls", matter_cls)
+    return calls
+
+
+def test_probe_lmax():
+    from glass.ext.cli.compute import probe_lmax
+    assert probe_lmax(Config({"fields.lmax": "100"})) == 100
+    assert probe_lmax(Config({"fields.lmax": "100",
+                              "fields.nside": "16"})) == 47
+    assert probe_lmax(Config({"fields.lmax": "30",
+                              "fields.nside": "16"})) == 30
+
+
+def test_auto_lmax(probe_cls):
+    from glass.ext.cli._cls import tail_error
+    from glass.ext.cli.compute import auto_lmax
+    config = Config({"fields.lmax": "200", "plot.accuracy": "1e-3"})
+    lmax, error, tolerance = auto_lmax(config, list(range(4)), None)
+    assert probe_cls == [(0,), (1,), (2,), (3,)]
+    l = np.arange(201)
+    expected = tail_error([(l + 1.)**-4])
+    assert tolerance == 1e-3
+    assert expected[lmax] <= tolerance < expected[lmax-1]
+    assert error == expected[lmax]
+
+    config["compute.cls.tolerance"] = "1e-9"
+    with pytest.warns(UserWarning, match="do not converge"):
+        lmax, error, tolerance = auto_lmax(config, list(range(4)), None)
+    assert lmax == 200
+    assert error == expected[199] > tolerance
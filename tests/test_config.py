@@ -0,0 +1,20 @@
+import click
+import pytest
+
+from glass.ext.cli.config import parse_override
+
+
+def test_parse_override():
+    assert parse_override("cosmo.h=0.7") == ("cosmo", "h", "0.7")
+    assert parse_override(" shells.grid.dz = 0.1 ") == (
+        "shells", "grid.dz", "0.1")
+    assert parse_override("fields.cls.path=a=b.npz") == (
+        "fields", "cls.path", "a=b.npz")
+    assert parse_override("fields.cls=") == ("fields", "cls", "")
+
+
+@pytest.mark.parametrize("override", ["cosmo.h", "h=0.7", ".h=0.7",
+                                      "cosmo.=0.7", ""])
+def test_parse_override_invalid(override):
+    with pytest.raises(click.BadParameter):
+        parse_override(override)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY = ("numpy", "matplotlib", "camb")
+
+SCRIPT = """\
+import sys
+from importlib import import_module
+cli = import_module(sys.argv[1]).cli
+cli.main(sys.argv[2:], prog_name="glass", standalone_mode=False)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+""".format(heavy=HEAVY)
+
+
+@pytest.mark.parametrize("module, args", [
+    ("__main__", ["--help"]),
+    ("bench", ["--help"]),
+    ("build", ["--help"]),
+    ("cache", ["--help"]),
+    ("compute", ["--help"]),
+    ("compute", ["cls", "--help"]),
+    ("compute", ["lensing-cls", "--help"]),
+    ("compute", ["maps", "--help"]),
+    ("config", ["--help"]),
+    ("plot", ["--help"]),
+    ("plot", ["lensing", "--help"]),
+    ("serve", ["--help"]),
+    ("sweep", ["--help"]),
+])
+def test_help_is_lightweight(module, args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.run([sys.executable, "-c", SCRIPT,
+                           f"glass.ext.cli.{module}", *args],
+                          capture_output=True, text=True, env=env,
+                          check=True)
+    assert proc.stdout.splitlines()[-1] == ""
@@ -0,0 +1,78 @@
+import click
+import pytest
+from click.testing import CliRunner
+
+import glass.ext.cli.__main__ as main
+import glass.ext.cli.config as config
+
+
+class Config(dict):
+    """Stand-in for the configuration class of the CLI."""
+
+
+@pytest.fixture
+def plugins(monkeypatch):
+    """Install plugin commands and a stand-in configuration loader."""
+    loads = []
+    commands = {}
+
+    def load_config(files, *, no_defaults=False, overrides=()):
+        loads.append(files)
+        return Config(o.split("=", 1) for o in overrides)
+
+    class EntryPoint:
+        def __init__(self, command):
+            self.command = command
+
+        def load(self):
+            return self.command
+
+    def add(command):
+        commands[command.name] = EntryPoint(command)
+        return command
+
+    monkeypatch.setattr(config, "load_config", load_config)
+    monkeypatch.setattr(main, "commands", lambda: commands)
+    return add, loads
+
+
+def test_pass_obj(plugins):
+    add, loads = plugins
+
+    @add
+    @click.command("obj")
+    @click.pass_obj
+    def obj(cfg):
+        click.echo(cfg["a.b"])
+
+    result = CliRunner().invoke(main.cli, ["-o", "a.b=1", "obj"])
+    assert result.exit_code == 0, result.output
+    assert result.output == "1\n"
+    assert len(loads) == 1
+
+
+def test_make_pass_decorator(plugins):
+    add, loads = plugins
+
+    @add
+    @click.command("decorated")
+    @click.make_pass_decorator(Config)
+    def decorated(cfg):
+        assert isinstance(cfg, Config)
+        click.echo(cfg["a.b"])
+
+    @add
+    @click.command("lazy")
+    @click.pass_obj
+    def lazy(cfg):
+        click.echo("not loaded")
+
+    result = CliRunner().invoke(main.cli, ["-o", "a.b=2", "decorated"])
+    assert result.exit_code == 0, result.output
+    assert result.output == "2\n"
+    assert len(loads) == 1
+
+    # the config is not loaded unless it is used
+    result = CliRunner().invoke(main.cli, ["lazy"])
+    assert result.exit_code == 0, result.output
+    assert len(loads) == 1
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from glass.ext.cli._maps import write_map
+
+
+@pytest.mark.parametrize("name", ["map.fits", "map.fits.gz", "map.npy"])
+def test_write_map(tmp_path, name):
+    pytest.importorskip("healpy")
+    import healpy as hp
+    path = str(tmp_path / name)
+    m = np.arange(12*4**2, dtype=float)
+    for _ in range(2):
+        write_map(path, m, np.float32)
+    loaded = np.load(path) if name.endswith(".npy") else hp.read_map(path)
+    assert loaded.dtype.newbyteorder("=") == np.float32
+    np.testing.assert_array_equal(loaded, m)
+    assert [p.name for p in tmp_path.iterdir()] == [name]
+
+
+def test_write_map_error(tmp_path, monkeypatch):
+    hp = pytest.importorskip("healpy")
+    path = str(tmp_path / "map.fits")
+    m = np.zeros(12)
+    write_map(path, m)
+
+    def write_map_partial(filename, *args, **kwargs):
+        with open(filename, "wb") as fp:
+            fp.write(b"SIMPLE")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(hp, "write_map", write_map_partial)
+    with pytest.raises(OSError):
+        write_map(path, m + 1)
+    np.testing.assert_array_equal(hp.read_map(path), m)
+    assert [p.name for p in tmp_path.iterdir()] == ["map.fits"]
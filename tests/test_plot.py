@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from glass.ext.cli._plot import lensing_approx
+
+
+def lensing_naive(lmat, cls, bins):
+    n = len(lmat)
+    size = min(len(cl) for cl in cls if len(cl) > 0)
+    out = np.zeros((len(bins), size))
+    for b, s in enumerate(bins):
+        for i in range(n):
+            for j in range(n):
+                cl = cls[max(i, j)*(max(i, j)+1)//2 + abs(i - j)]
+                if len(cl) > 0:
+                    out[b] += lmat[s, i]*lmat[s, j]*cl[:size]
+    return out
+
+
+@pytest.mark.parametrize("bandwidth", [None, 0, 2])
+def test_lensing_approx(bandwidth):
+    rng = np.random.default_rng(42)
+    n, size = 6, 8
+    lmat = np.tril(rng.random((n, n)), -1)
+    cls = []
+    for i in range(n):
+        for j in range(i, -1, -1):
+            if bandwidth is None or i - j <= bandwidth:
+                cls.append(rng.random(size + i))
+            else:
+                cls.append(np.empty(0))
+    bins = [1, 3, 5]
+    np.testing.assert_allclose(lensing_approx(lmat, cls, bins),
+                               lensing_naive(lmat, cls, bins))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_figure_writer(tmp_path, jobs):
+    import click
+    import matplotlib
+    matplotlib.use("agg")
+    import matplotlib.pyplot as plt
+    from glass.ext.cli.plot import FigureWriter
+    paths = [str(tmp_path / f"fig{k}.png") for k in range(3)]
+    with FigureWriter(jobs) as writer:
+        for path in paths:
+            fig = plt.figure()
+            writer.submit(fig, [path, path[:-3] + "pdf"])
+    assert plt.get_fignums() == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "fig0.pdf", "fig0.png", "fig1.pdf", "fig1.png", "fig2.pdf",
+        "fig2.png"]
+    with pytest.raises(click.ClickException, match="missing"):
+        with FigureWriter(jobs) as writer:
+            writer.submit(plt.figure(), [str(tmp_path / "missing/fig.png")])
+            writer.submit(plt.figure(), [str(tmp_path / "fig.png")])
+    assert (tmp_path / "fig.png").exists()
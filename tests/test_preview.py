@@ -0,0 +1,31 @@
+import numpy as np
+
+from glass.ext.cli._preview import flat_sky_cls, power_spectrum
+
+
+def flat_sky_naive(ti, tj, modes, k, power):
+    (chi_i, ft_i), (chi_j, ft_j) = ti, tj
+    chi = np.sqrt(chi_i*chi_j)
+    kk = np.hypot(k, (modes[:, None] + 0.5)/chi)
+    cl = np.trapz((ft_i*ft_j.conj()).real*power(kk), k, axis=-1)
+    return cl/(np.pi*chi**2)
+
+
+def test_flat_sky_cls():
+    rng = np.random.default_rng(2)
+    power = power_spectrum(0.2)
+    k = np.linspace(0., 0.2, 500)
+    modes = np.array([30, 50, 100, 300, 1000])
+    transforms = []
+    for chi in 100., 800., 900., 3000.:
+        x = chi + rng.normal(0., 50., size=20)
+        transforms.append((chi, np.exp(1j*k[:, None]*x).mean(axis=-1)))
+    pairs = [(i, j) for i in range(4) for j in range(i)]
+    cls = flat_sky_cls(transforms, pairs, modes, k, power)
+    for (i, j), cl in zip(pairs, cls):
+        naive = flat_sky_naive(transforms[i], transforms[j], modes, k, power)
+        scale = np.sqrt(np.abs(flat_sky_naive(transforms[i], transforms[i],
+                                              modes, k, power)
+                               * flat_sky_naive(transforms[j], transforms[j],
+                                                modes, k, power)))
+        np.testing.assert_allclose(cl, naive, rtol=0, atol=1e-3*scale.max())
@@ -0,0 +1,94 @@
+import json
+import os
+import socket
+import threading
+
+import click
+import pytest
+
+from glass.ext.cli import _serve
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve a single connection with a scripted list of replies."""
+    path = str(tmp_path / "s.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    requests = []
+
+    def start(replies):
+        def run():
+            conn, _ = sock.accept()
+            with conn, conn.makefile("rwb") as fp:
+                requests.append(json.loads(fp.readline()))
+                for reply in replies:
+                    _serve.send(fp, reply)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    yield path, start, requests
+    sock.close()
+
+
+def test_forward(server, capsys, monkeypatch):
+    path, start, requests = server
+    monkeypatch.setenv("GLASS_PROFILE", "prof")
+    monkeypatch.setenv("OTHER", "1")
+    thread = start([{"out": "hello\n"}, {"err": "warning\n"}, {"exit": 3}])
+    assert _serve.forward(["compute", "cls"], path) == 3
+    thread.join()
+    (request,) = requests
+    assert request["args"] == ["compute", "cls"]
+    assert request["cwd"] == os.getcwd()
+    assert request["env"]["GLASS_PROFILE"] == "prof"
+    assert "OTHER" not in request["env"]
+    out, err = capsys.readouterr()
+    assert out == "hello\n"
+    assert err == "warning\n"
+
+
+def test_forward_lost(server):
+    path, start, _ = server
+    thread = start([{"out": "hello\n"}])
+    with pytest.raises(click.ClickException, match="lost"):
+        _serve.forward([], path)
+    thread.join()
+
+
+def test_forward_no_server(tmp_path):
+    with pytest.raises(click.ClickException, match="cannot connect"):
+        _serve.forward([], str(tmp_path / "missing.sock"))
+
+
+def test_handle(tmp_path, monkeypatch):
+    seen = {}
+
+    def run_command(args):
+        seen["cwd"] = os.getcwd()
+        seen["env"] = os.environ.get("GLASS_TEST")
+        click.echo("out")
+        click.echo("err", err=True)
+        return 2
+
+    monkeypatch.setattr(_serve, "run_command", run_command)
+    monkeypatch.delenv("GLASS_TEST", raising=False)
+    cwd = os.getcwd()
+    client, conn = socket.socketpair()
+    with client, client.makefile("rwb") as fp:
+        _serve.send(fp, {"args": ["x"], "cwd": str(tmp_path),
+                         "env": {"GLASS_TEST": "1"}})
+        _serve.handle(conn)
+        messages = [json.loads(line) for line in fp]
+    assert seen == {"cwd": str(tmp_path), "env": "1"}
+    assert messages == [{"out": "out\n"}, {"err": "err\n"}, {"exit": 2}]
+    assert os.getcwd() == cwd
+    assert "GLASS_TEST" not in os.environ
+
+
+def test_run_command_errors(capsys):
+    assert _serve.run_command(["--no-such-option"]) == 2
+    assert "no-such-option" in capsys.readouterr().err
@@ -0,0 +1,112 @@
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from glass.ext.cli._shells import ShellIndex
+
+Window = namedtuple("Window", ["za", "wa", "zeff"])
+
+
+def argmin_nearest(shells, redshifts):
+    zeff = np.array([w.zeff for w in shells])
+    return [int(np.argmin(np.fabs(zeff - z))) for z in redshifts]
+
+
+def tophats(edges):
+    return [Window(np.array([lo, hi]), np.ones(2), (lo + hi)/2)
+            for lo, hi in zip(edges, edges[1:])]
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_nearest(shuffle):
+    rng = np.random.default_rng(3)
+    shells = tophats(np.linspace(0., 3., 31))
+    if shuffle:
+        shells = [shells[i] for i in rng.permutation(len(shells))]
+    redshifts = np.concatenate([rng.uniform(-1., 4., 200),
+                                [w.zeff for w in shells]])
+    index = ShellIndex(shells)
+    assert index.nearest(redshifts) == argmin_nearest(shells, redshifts)
+
+
+def test_nearest_ties():
+    # effective redshifts and midpoints are exact in binary
+    shells = tophats([0., 0.5, 1., 1.5, 2.])
+    redshifts = [0.5, 1., 1.5, 0., 2.]
+    index = ShellIndex(shells)
+    assert index.nearest(redshifts) == argmin_nearest(shells, redshifts)
+    assert index.nearest([0.5]) == [0]
+
+
+def test_total_window():
+    rng = np.random.default_rng(4)
+    edges = np.linspace(0., 2., 11)
+    shells = []
+    for lo, hi in zip(edges, edges[1:]):
+        za = np.linspace(lo - 0.1, hi + 0.1, 7).clip(0.)
+        wa = rng.random(7)
+        shells.append(Window(za, wa, (lo + hi)/2))
+    index = ShellIndex(shells)
+    z, w = index.total_window()
+    assert np.all(np.diff(z) > 0)
+    expected = sum(np.interp(z, s.za, s.wa, left=0., right=0.)
+                   for s in shells)
+    np.testing.assert_allclose(w, expected)
+
+
+def test_total_window_shared_points():
+    index = ShellIndex(tophats(np.linspace(0., 2., 11)))
+    z, w = index.total_window()
+    np.testing.assert_array_equal(z, np.linspace(0., 2., 11))
+    np.testing.assert_array_equal(w, 1.)
+
+
+class Cosmology:
+    """Matter and curvature cosmology with distances by quadrature."""
+
+    omega_m = 0.3
+
+    def __init__(self, omega_k=0.):
+        self.omega_k = omega_k
+        self.zt = np.linspace(0., 5., 20001)
+        f = 1/self.ef(self.zt)
+        dx = np.diff(self.zt)*(f[1:] + f[:-1])/2
+        self.xt = np.concatenate([[0.], np.cumsum(dx)])
+
+    def ef(self, z):
+        z = np.asarray(z)
+        return np.sqrt(self.omega_m*(1 + z)**3 + self.omega_k*(1 + z)**2
+                       + 1 - self.omega_m - self.omega_k)
+
+    def xc(self, z, zp=None):
+        x = np.interp(z, self.zt, self.xt)
+        return x if zp is None else np.interp(zp, self.zt, self.xt) - x
+
+    def xm(self, z, zp=None):
+        x = self.xc(z, zp)
+        if self.omega_k > 0:
+            return np.sinh(x*self.omega_k**0.5)/self.omega_k**0.5
+        if self.omega_k < 0:
+            return np.sin(x*(-self.omega_k)**0.5)/(-self.omega_k)**0.5
+        return x
+
+
+@pytest.mark.parametrize("omega_k", [0., 0.1, -0.1])
+def test_lensing_kernels(omega_k):
+    from glass.ext.cli._shells import lensing_kernels
+    cosmo = Cosmology(omega_k)
+    zsrc = [0.05, 0.5, 1.0, 2.0]
+    z, w = lensing_kernels(cosmo, zsrc, 200)
+    assert np.all(np.diff(z) > 0)
+    assert w.shape == (len(zsrc), len(z))
+    for zs, wk in zip(zsrc, w):
+        n = np.searchsorted(z, zs, side="right")
+        assert z[n-1] == zs
+        expected = (3*cosmo.omega_m/2*cosmo.xm(z[:n])*(1 + z[:n])
+                    / cosmo.ef(z[:n])*cosmo.xm(z[:n], zs)/cosmo.xm(zs))
+        np.testing.assert_allclose(wk[:n], expected, rtol=1e-10,
+                                   atol=1e-14)
+        assert np.all(wk[n:] == 0)
+        # low sources keep all samples of their own grid
+        assert n >= 200
@@ -0,0 +1,22 @@
+import click
+import pytest
+
+from glass.ext.cli.sweep import parse_param, point_path
+
+
+def test_parse_param():
+    assert parse_param("cosmo.h=0.6, 0.7,") == ("cosmo.h", ["0.6", "0.7"])
+    with pytest.raises(click.BadParameter):
+        parse_param("cosmo.h")
+    with pytest.raises(click.BadParameter):
+        parse_param("h=0.6,0.7")
+    with pytest.raises(click.BadParameter):
+        parse_param("cosmo.h=,")
+
+
+def test_point_path():
+    point = {"cosmo.h": "0.7", "shells.grid.dz": "0.1"}
+    path = point_path("cls-{index}-{cosmo.h}-{shells.grid.dz}.npz", 3, point)
+    assert path == "cls-3-0.7-0.1.npz"
+    with pytest.raises(click.BadParameter):
+        point_path("cls-{cosmo.omega_m}.npz", 0, point)